@@ -0,0 +1,270 @@
+import asyncio
+import os
+import re
+import weakref
+from urllib.parse import urlsplit
+import agent
+import compilation
+import diagnostics
+import runner
+import transport
+import workspace
+
+# maximum number of requests that are sent to one server at the same time
+DEFAULT_ENDPOINT_CONCURRENCY = 4
+
+# the number of requests which can be sent to the server at once, per server
+_endpoint_concurrency = {}
+
+# one semaphore per server, shared by all async agents on the same event loop;
+# a semaphore can only be used on one loop, so every loop (asyncio.run) gets its own
+_endpoint_limits = weakref.WeakKeyDictionary()
+
+
+def set_endpoint_concurrency(url: str, limit: int):
+    '''This function sets how many requests can be sent to the server of the url at once.
+    It has to be called before the agents start talking to the server.'''
+    _endpoint_concurrency[urlsplit(url).netloc] = limit
+
+
+def endpoint_limit(url: str) -> asyncio.Semaphore:
+    '''This function returns the semaphore of the running event loop,
+    which limits the requests to the server of the url.'''
+    host = urlsplit(url).netloc
+    limits = _endpoint_limits.setdefault(asyncio.get_running_loop(), {})
+    if host not in limits:
+        limits[host] = asyncio.Semaphore(_endpoint_concurrency.get(host, DEFAULT_ENDPOINT_CONCURRENCY))
+    return limits[host]
+
+
+async def achat(url, data, headers=None, stream=False):
+    '''This function is the awaitable version of Transport.chat.
+    The request runs on a worker thread using the shared, pooled transport,
+    so the event loop can serve the other conversations in the meantime.'''
+    async with endpoint_limit(url):
+        return await asyncio.to_thread(transport.get_transport().chat, url, data, headers, stream)
+
+
+def extract_code(markdown: str, language: str) -> str:
+    '''This function extracts the code in the given language from a markdown string.'''
+    match = re.search(rf"```{language}(.*?)```", markdown or "", re.DOTALL | re.IGNORECASE)
+    if match:
+        return match.group(1).strip()
+    return ""
+
+
+class AsyncAgentAI(agent.AgentAI):
+    '''This class is the asyncio counterpart of the AgentAI class.
+    It keeps the conversation in the same way, but get_response is awaitable,
+    so many agents can talk to the servers at the same time on one event loop.'''
+
+    async def get_response(self, prompt, stream=False):
+        '''This method gets the response from the model without blocking the event loop.'''
+
+        # add the user prompt to the messages list
+        self.messages.append({"role": "user", "content": prompt})
+
+        data, headers = self._request(stream)
+
+        response_raw = await achat(self.url, data, headers, stream)
+        if response_raw is None:
+            return None
+
+        # add the response to the messages list
+        self.messages.append({"role": "assistant", "content": response_raw})
+        return response_raw
+
+
+class AsyncAgentAIC(AsyncAgentAI):
+    '''This class is the asyncio counterpart of the AgentAIC class.
+    It generates C code, compiles it with gcc in a subprocess and asks
+    the model to fix the compilation errors, without blocking the event loop.
+    Every compilation runs in its own temporary directory, so many agents
+    can compile at the same time.'''
+
+    def __init__(self, server_address, model_name, my_role, max_tokens=16000, api_key=""):
+        super().__init__(server_address, model_name, my_role, max_tokens, api_key)
+        self.compile_result = ""                # result of the last compilation using gcc
+
+        # initial compile messages queue
+        self.__initial_compile_messages = [
+            {"role": "system",
+             "content": "You are a C Programmer. You solve problems with C programs, no comments or explanations. "
+            }
+        ]
+
+    async def __get_response_compilation(self, compile_messages: list) -> str:
+        '''This method sends the conversation about the compilation errors to the model.'''
+        data = {
+            "model": self.model_name,
+            "messages": compile_messages,
+            "stream": False,
+            "temperature": 0.0,
+        }
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+
+        return await achat(self.url, data, headers)
+
+    async def compile_code(self, code: str) -> str:
+        '''This method compiles the code using gcc in a subprocess.
+        It returns the result of the compilation.'''
+        if code == "":
+            return "No code found"
+
+        with workspace.scratch() as workdir:
+            source = os.path.join(workdir, 'code_temp.c')
+            with open(source, 'w') as f:
+                f.write(code)
+
+            process = await asyncio.create_subprocess_exec(
+                'gcc', *compilation.gcc_flags(), source, '-o', os.path.join(workdir, 'a.out'), *compilation.GCC_LIBS,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE)
+            _, stderr = await process.communicate()
+
+        records = diagnostics.parse(stderr.decode())
+        if diagnostics.has_errors(records):
+            return f"Compilation error:\n{diagnostics.render(records, code)}"
+        return "Compilation successful"
+
+    async def start(self, tries: int, prompt: str, stream: bool = False) -> str:
+        '''This method is the async version of AgentAIC.start.
+        It gets the code from the model and tries to fix the compilation
+        problems at most tries times.'''
+
+        # the answer does not go to the messages list here,
+        # only the final result does (as in AgentAIC)
+        self.messages.append({"role": "user", "content": prompt})
+        data, headers = self._request(stream)
+        response = await achat(self.url, data, headers, stream)
+
+        code = extract_code(response, 'c')
+        self.compile_result = await self.compile_code(code)
+        strResult = code
+
+        # every problem starts with a fresh compile conversation
+        compile_messages = list(self.__initial_compile_messages)
+
+        attempt = 0
+        while attempt < tries and self.compile_result != "Compilation successful":
+            strPrompt = compilation.repair_prompt(code, self.compile_result)
+            compile_messages.append({"role": "user", "content": strPrompt})
+
+            strResult = await self.__get_response_compilation(compile_messages)
+            code = extract_code(strResult, 'c')
+            self.compile_result = await self.compile_code(code)
+
+            if self.compile_result == "Compilation successful":
+                break
+            attempt += 1
+
+        if attempt == tries and self.compile_result != "Compilation successful":
+            strResult = f'Compilation failed after {attempt} attempts. Code: {code}, the last error was: {self.compile_result}'
+
+        # add this to the messages in the main conversation
+        self.messages.append({"role": "assistant", "content": strResult})
+        return strResult
+
+
+class AsyncAgentInterpreter(AsyncAgentAI):
+    '''This class is the asyncio counterpart of the AgentInterpreter class.
+    It runs the Python code in a subprocess and asks the model to fix
+    the errors, without blocking the event loop.'''
+
+    def __init__(self, server_address, model_name, trials: int = 3, timeout_seconds: int = 10, api_key=""):
+        super().__init__(server_address, model_name,
+                         "You are a Python Programmer. You solve problems with Python programs, no comments or explanations. ",
+                         api_key=api_key or os.getenv('OPENAI_API_KEY', ''))
+        self.trials = trials                        # number of trials to fix the interpretation errors
+        self.timeout_seconds = timeout_seconds      # max seconds to wait for code execution
+        self.last_run = None                        # the last run of the code, see runner.run_program
+
+    def _request(self, stream=False):
+        '''This method creates the chat request; the fixes are asked for deterministically.'''
+        data, headers = super()._request(stream)
+        data["temperature"] = 0.0
+        return data, headers
+
+    async def interpret_code(self, code: str) -> str:
+        '''This method runs the code with runner.run_program on a worker thread,
+        so it has the same limits (output, stalls, waiting for input) and uses the
+        same caches as AgentInterpreter, without blocking the event loop.
+        It returns the result of the interpretation.'''
+        if code == "":
+            return "No code found"
+        return await asyncio.to_thread(self.__interpret, code)
+
+    def __interpret(self, code: str) -> str:
+        '''This method checks the syntax of the code and runs it (on a worker thread).'''
+        with workspace.scratch() as workdir:
+            script = os.path.join(workdir, 'code_temp.py')
+
+            # a syntax error is found without starting python
+            syntax_error = runner.check_python(code, script)
+            if syntax_error is not None:
+                self.last_run = syntax_error
+                return f"Interpretation error: {syntax_error['stderr']}"
+
+            with open(script, 'w') as f:
+                f.write(code)
+            result = runner.run_program('python3', script, code, timeout=self.timeout_seconds)
+        self.last_run = result
+
+        if result["status"] == "timeout":
+            return "Timeout"
+        if result["status"] == "output limit":
+            return f"Interpretation error: the program was stopped because it printed too much output: {result['stdout']}"
+        if result["status"] == "waiting for input":
+            return f"Interpretation error: the program waits for input on stdin, but there is no more input. Its output was: {result['stdout']}"
+        if result["status"] == "stalled":
+            return f"Interpretation error: the program stopped making progress (no CPU time and no output for {runner.DEFAULT_STALL_SECONDS} seconds). Its output was: {result['stdout']}"
+
+        # check if the output of the interpretation contains the word "error"
+        if 'error' in result["stderr"]:
+            return f"Interpretation error: {result['stderr']}"
+        return "Interpretation successful"
+
+    async def get_response(self, code: str):
+        '''This method runs the code and tries to fix the errors.
+        It returns the code and the result of the last interpretation.'''
+        if ("```python" in code.lower()) or ("```markdown" in code.lower()):
+            code = extract_code(code, 'python') or extract_code(code, 'markdown')
+
+        result = await self.interpret_code(code)
+
+        attempts = 0
+        while attempts < self.trials and result not in ("Interpretation successful", "Timeout"):
+            strPrompt = f'For this program {code}, I got the following interpretation error: {result}. Please fix the code and return the fixed code in a markdown code block.'
+            strResult = await AsyncAgentAI.get_response(self, strPrompt)
+            code = extract_code(strResult, 'python') or code
+            result = await self.interpret_code(code)
+            attempts += 1
+
+        return code, result
+
+
+class AsyncAgentAIPy(AsyncAgentAI):
+    '''This class is the asyncio counterpart of the AgentAIPy class.
+    The answer of the model is run and repaired by an AsyncAgentInterpreter
+    before it is returned.'''
+
+    async def get_response(self, prompt, stream=False):
+        '''This method gets the code from the model and returns it after interpretation.'''
+        self.messages.append({"role": "user", "content": prompt})
+        data, headers = self._request(stream)
+
+        response_raw = await achat(self.url, data, headers, stream)
+        if response_raw is None:
+            return None
+
+        agentInterpreter = AsyncAgentInterpreter(server_address=self.server_address,
+                                                 model_name=self.model_name,
+                                                 trials=3,
+                                                 api_key=self.api_key)
+        strCodeResponse, interpretation_result = await agentInterpreter.get_response(response_raw)
+
+        # add the response to the messages list
+        self.messages.append({"role": "assistant", "content": strCodeResponse})
+        return strCodeResponse
@@ -1,8 +1,10 @@
 import agent
-import subprocess
 import re
-import requests
-import json
+import transport
+import compilation
+import runlog
+import runner
+import workspace
 
 class AgentAIC(agent.AgentAI):
     '''This class is an agent that uses the Ollama server to generate C code.
@@ -18,14 +20,20 @@ class AgentAIC(agent.AgentAI):
     1. The first one is the main conversation between the model and the user.
     2. The second one is the conversation between the model and the user that is aimed to solve compilation errors.'''
 
-    def __init__(self, server_address, model_name, my_role):
+    def __init__(self, server_address, model_name, my_role, context_tokens=None):
         self.server_address = server_address        # address of the server
         self.model_name = model_name                # name of the model 
+        self.context_tokens = context_tokens        # token budget of one request in the main conversation
         self.url = f'{self.server_address}/api/chat'    # chat API endpoint
         self.__response = ""                    # response from the model
         self.__mdCode = ""                      # markdown code block, which is part of the response
         self.__code = ""                        # just the code from the markdown code block   
         self.__compile_result = ""              # result of the compilation using gcc
+        self.__stream = False                   # stream the answers and stop after the code block
+        self.__candidates = 1                   # repair candidates requested at once
+        self.last_run = None                    # the run of the last compiled code, see runner.run_program
+        self.__binary = None                    # the binary of the last successful compilation
+        self.__workdir = workspace.create(self, 'agentc_')   # scratch directory of this agent
         
         # the main conversation between the model
         self.messages = [                   
@@ -43,96 +51,59 @@ class AgentAIC(agent.AgentAI):
 
         # the conversation between the model and the user
         # that is aimed to solve compilation errors
-        self.__compile_messages = self.__initial_compile_messages
+        self.__compile_messages = list(self.__initial_compile_messages)
 
-    def get_response(self, prompt):
+    def get_response(self, prompt, stream=False):
         '''This method gets the response from the model.
-        It sends the prompt to the model and returns the response.'''
+        It sends the prompt to the model and returns the response.
+        With stream=True the request is stopped after the first code block.'''
         # send a request to the ollama server
         
         # add the user prompt to the messages list
         self.messages.append({"role": "user", "content": prompt})
 
+        data, headers = self._request(stream)
+
+        response_raw = transport.get_transport().chat(self.url, data, headers, stream=stream)
+        if response_raw is None:
+            return None
+
+        # this is the difference to the parent class
+        # we do NOT add the response to the messages list
+        return response_raw
+
+    def _request(self, stream=False):
+        '''This method creates the body and the headers of the chat request.'''
         data = {
             "model": self.model_name,
-            "messages": self.messages,
-            "stream": False,
+            "messages": self.context_messages(),
+            "stream": stream,
             "temperature": 0.3,             # adjust this parameter to control the randomness of the output
             "max_tokens": 2096,             # adjust this parameter to control the length of the output
         }
 
         headers = {'Content-Type': 'application/json'}
+        return data, headers
 
-        retries = 3
-        for attempt in range(retries):
-            try:
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['message']['content']
-
-                    # this is the difference to the parent class
-                    # we do NOT add the response to the messages list
-                    return response_raw
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-                    return None
-
-    def __get_response_compilation(self, prompt: str) -> str:
+    def __get_response_compilation(self, prompt: str, temperature: float = 0.0, seed=None, cancel=None) -> str:
         '''This method gets the response from the model. 
-        It sends the prompt to the model and returns the response.'''
+        It sends the prompt to the model and returns the response.
+        Setting the cancel event (if given) stops the request.'''
         
         data = {
             "model": self.model_name,
             "messages": self.__compile_messages,
             "stream": False,
-            "temperature": 0.0,
+            "temperature": temperature,
         }
+        if seed is not None:
+            # different seeds give different repair candidates
+            data["seed"] = seed
         headers = {'Content-Type': 'application/json'}
 
-        # we use three retries just in case the server is busy
+        # the shared transport retries in case the server is busy
         # or there is a timeout
-        retries = 3     
-
-
-        for attempt in range(retries):
-            try:
-                # communicate with the server
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['message']['content']
-
-                    return response_raw
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-            return None
+        return transport.get_transport().chat(self.url, data, headers, stream=self.__stream, cancel=cancel)
 
     def __extract_c_code(self, markdown: str) -> str:
         '''This function extracts the C code from a markdown string.'''
@@ -167,31 +138,22 @@ class AgentAIC(agent.AgentAI):
         '''This method compiles the code using gcc.
         It returns the result of the compilation.'''
 
-        if self.__code != "":
-            with open(f'./temp/code_temp.c', 'w+') as f:
-                f.write(self.__code)
-            # compile the code using gcc
-            result = subprocess.run(['gcc', '-w', f'./temp/code_temp.c', '-o', './temp/a.out', '-lm'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # print the output of the compilation
-            # print(result.stdout.decode())
-            # print(result.stderr.decode())
-
-            # check if the output of the compilation contains the word "error"
-            if b'error' in result.stderr:
-                self.__compile_result = f"Compilation error: {result.stderr.decode()}"
-            else:
-                self.__compile_result = "Compilation successful"
-        else:
-            self.__compile_result = "No code found"   
-
+        self.__compile_result, binary = compilation.compile_binary(self.__code, self.__workdir)
+        self.__keep_binary(binary)
         return self.__compile_result
 
+    def __keep_binary(self, binary):
+        '''This method keeps the binary of the last successful compilation (or None),
+        so the program is run without compiling it again.'''
+        if self.__binary is not None and self.__binary is not binary:
+            self.__binary.close()
+        self.__binary = binary
+
     def __solve_problem(self) -> str:
         '''This method solves the compilation problems using the model.
         It sends the prompt to the model and returns the response.'''     
 
-        strPrompt = f'For this program {self.__code}, I got the following compilation error: {self.__compile_result}. Please fix the code and return the fixed code in a markdown code block.'
+        strPrompt = compilation.repair_prompt(self.__code, self.__compile_result)
         
         # please note that we use the __compile_messages list to store the conversation
         # between the model and the user
@@ -200,17 +162,39 @@ class AgentAIC(agent.AgentAI):
         # get the response from the model
         strResult = self.__get_response_compilation(strPrompt)
         return strResult
+
+    def __solve_problem_speculative(self):
+        '''This method asks the model for several fixes at the same time.
+        The first candidate is the deterministic one, the others are sampled.
+        It returns the answer, the code, the compilation result and the binary
+        of the first candidate which compiles.'''
+
+        strPrompt = compilation.repair_prompt(self.__code, self.__compile_result)
+        self.__compile_messages.append({"role": "user", "content": strPrompt})
+
+        return compilation.first_compiling(
+            lambda i, cancel: self.__get_response_compilation(strPrompt,
+                                                              temperature=0.0 if i == 0 else 0.7,
+                                                              seed=i,
+                                                              cancel=cancel),
+            self.__candidates)
     
-    def start(self, tries: int, prompt: str) -> str:
+    def start(self, tries: int, prompt: str, stream: bool = False, candidates: int = 1) -> str:
         '''This method starts the agent. 
         It talks to the model and tries to fix problems if there are any.
-        It sends the prompt to the model and returns the response.'''
+        It sends the prompt to the model and returns the response.
+        With stream=True every answer is streamed and the request is stopped
+        as soon as the code block is complete, so the compilation starts earlier.
+        With candidates > 1 every repair round asks for that many fixes at once,
+        compiles them in parallel and continues with the first which compiles.'''
         
         attempt = 0
         __strResult = ""
+        self.__stream = stream
+        self.__candidates = candidates
         
         # get the response from the server
-        self.__response = self.get_response(prompt)
+        self.__response = self.get_response(prompt, stream)
 
         self.__mdCode = self.__get_code(self.__response)
         
@@ -218,18 +202,27 @@ class AgentAIC(agent.AgentAI):
         
         # compile the code
         self.compile_result = self.__compile_code(self.__code)
+        runlog.event("compilation", self, attempt=0, result=self.__compile_result)
         
         __strResult = self.__code
         
         while attempt < tries and self.__compile_result != "Compilation successful":
-            # solve the problem
-            __strResult = self.__solve_problem()
+            if self.__candidates > 1:
+                # solve the problem with several candidates at once,
+                # they are already compiled when we get them back
+                __strResult, self.__code, self.__compile_result, binary = self.__solve_problem_speculative()
+                self.__keep_binary(binary)
+            else:
+                # solve the problem
+                __strResult = self.__solve_problem()
 
-            # compile the result
-            self.__code = self.__get_code(__strResult)
-            
-            # checking the compilation result of the code
-            self.__compile_result = self.__compile_code(self.__code)
+                # compile the result
+                self.__code = self.__get_code(__strResult)
+                
+                # checking the compilation result of the code
+                self.__compile_result = self.__compile_code(self.__code)
+
+            runlog.event("compilation", self, attempt=attempt + 1, result=self.__compile_result)
 
             # if the compilation was successful, we break the loop
             # if the compilation was not successful, we try again
@@ -244,16 +237,26 @@ class AgentAIC(agent.AgentAI):
         # if yes, then we return the code only
         if attempt == tries and self.__compile_result != "Compilation successful":
             strResult = f'Compilation failed after {attempt} attempts. Code: {self.__code}, the last error was: {self.__compile_result}'
+            self.last_run = None
         else:
             strResult = __strResult
 
+            # run the program to see how it behaves and what it costs,
+            # from the binary of the compilation which succeeded
+            self.last_run = compilation.run_binary(self.__binary) if self.__binary is not None else None
+            if self.last_run is not None:
+                print(f'Run: {runner.summary(self.last_run)}')
+                runlog.event("run", self, summary=runner.summary(self.last_run))
+
+        self.__keep_binary(None)
+
         # add this to the messages in the main conversation
         self.messages.append({"role": "assistant", "content": strResult})
 
         # and clean up the compile messages
         # it is important because the next time we need to solve a problem
         # it is a different problem and the situation must start from scratch
-        self.__compile_messages = self.__initial_compile_messages
+        self.__compile_messages = list(self.__initial_compile_messages)
 
         # return the result
         return strResult
\ No newline at end of file
@@ -0,0 +1,121 @@
+# Cache of the gcc compilations of the generated code
+#
+# python3 compilecache.py --stats     shows how many compilations are cached
+# python3 compilecache.py --clear     removes all cached compilations
+import hashlib
+import json
+import subprocess
+from execcache import tool_version
+from lrustore import LRUStore
+
+
+class CompileCache(LRUStore):
+    '''This class is a persistent cache of the gcc compilations, like ccache.
+    It is stored in a local SQLite database, so the compilations survive between runs.
+
+    A successful compilation is stored under the hash of the preprocessed source,
+    the version of gcc and its flags, with the diagnostics of gcc and
+    the binary. The same (raw) source is found directly, without running
+    gcc at all; a source which differs only in comments or macros
+    is found after preprocessing it. A failed compilation is stored
+    under the hash of the raw source, as its diagnostics refer to its lines.
+    When the stored binaries grow over max_bytes, the least recently used
+    compilations are removed.'''
+
+    table = 'compilations'
+    columns = (('diagnostics', 'TEXT NOT NULL'), ('binary', 'BLOB'))
+    description = 'the gcc compilations'
+    noun = 'compilations'
+
+    def __init__(self, path='cache/compilations.sqlite', max_bytes=256 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+        # the raw source -> the key of its compilation
+        self._db.execute('''CREATE TABLE IF NOT EXISTS sources (
+                                source_key TEXT PRIMARY KEY,
+                                key TEXT NOT NULL)''')
+        self._db.commit()
+
+    @staticmethod
+    def key(text: str, compiler: str, flags) -> str:
+        '''This method computes the key of a (raw or preprocessed) source.'''
+        compilation = {
+            "source": text,
+            "compiler": tool_version(compiler),
+            "flags": list(flags),
+        }
+        return hashlib.sha256(json.dumps(compilation, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def preprocess(code: str, compiler: str, flags):
+        '''This method preprocesses the code, without the line markers,
+        so the name of the source file does not change the key.
+        It returns the preprocessed code, or None if it fails.'''
+        result = subprocess.run([compiler, '-E', '-P', *[f for f in flags if f.startswith(('-D', '-U', '-I', '-std'))], '-x', 'c', '-'],
+                                input=code.encode('utf-8'), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            return None
+        return result.stdout.decode('utf-8', errors='replace')
+
+    def lookup(self, code: str, compiler: str, flags):
+        '''This method finds the compilation of the code.
+        It returns (diagnostics, binary or None, key), where diagnostics is None
+        on a miss; the key is the one to pass to store.
+        A failed compilation is found only for the same raw source: its diagnostics
+        quote the lines of the source, which comments or blank lines move.
+        A successful one (a binary) is found for any source which preprocesses the same.'''
+        source_key = self.key(code, compiler, flags)
+        row = self._lookup(source_key, 'AND binary IS NULL', count_miss=False)
+        if row is not None:
+            return row[0], row[1], (source_key, source_key)
+        with self._lock:
+            row = self._db.execute('SELECT key FROM sources WHERE source_key = ?', (source_key,)).fetchone()
+        key = row[0] if row is not None else None
+
+        if key is None:
+            preprocessed = self.preprocess(code, compiler, flags)
+            # a source which cannot be preprocessed is cached under its own text
+            key = self.key(preprocessed, compiler, flags) if preprocessed is not None else source_key
+            with self._lock:
+                self._db.execute('INSERT OR REPLACE INTO sources (source_key, key) VALUES (?, ?)', (source_key, key))
+                self._db.commit()
+
+        row = self._lookup(key, 'AND binary IS NOT NULL')
+        if row is None:
+            return None, None, (source_key, key)
+        return row[0], row[1], (source_key, key)
+
+    def store(self, key, diagnostics: str, binary):
+        '''This method stores the compilation under the key from lookup and removes
+        the least recently used compilations if the cache is over its size bound.
+        A failed compilation (no binary) is stored under its raw source only.'''
+        source_key, compiled_key = key
+        self._store(compiled_key if binary is not None else source_key, (diagnostics, binary))
+
+    def _evicted(self, key: str):
+        self._db.execute('DELETE FROM sources WHERE key = ?', (key,))
+
+    def clear(self):
+        '''This method removes all cached compilations.'''
+        super().clear()
+        with self._lock:
+            self._db.execute('DELETE FROM sources')
+            self._db.commit()
+
+
+# the cache used by the compilations in this process, None if caching is off
+_shared_cache = None
+
+
+def get_cache():
+    '''This function returns the compilation cache of the process, or None if caching is off.'''
+    return _shared_cache
+
+
+def set_cache(cache):
+    '''This function turns the compilation cache of the process on (a CompileCache) or off (None).'''
+    global _shared_cache
+    _shared_cache = cache
+
+
+if __name__ == '__main__':
+    CompileCache.main()
@@ -0,0 +1,106 @@
+# Append-only store of the conversations of the agents
+#
+# python3 conversationstore.py --list                                  lists the stored conversations
+# python3 conversationstore.py --export <conversation> --output a.xlsx  exports one (.xlsx, .csv or .html)
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+
+class ConversationStore:
+    '''This class stores the conversations (the messages of the agents, or any
+    other records, e.g. the conversation log of main.py) in a local SQLite database.
+    Every turn only the new records are appended, so saving costs the same
+    in the first and in the hundredth iteration; the records are exported
+    to Excel, CSV or HTML on demand, once.'''
+
+    def __init__(self, path='results/conversations.sqlite'):
+        self.path = path                    # the SQLite file
+        self.__lock = threading.Lock()
+        self.__saved = {}                   # conversation -> number of stored records
+
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__db.execute('''CREATE TABLE IF NOT EXISTS records (
+                                conversation TEXT NOT NULL,
+                                position INTEGER NOT NULL,
+                                time REAL NOT NULL,
+                                data TEXT NOT NULL,
+                                PRIMARY KEY (conversation, position))''')
+        self.__db.commit()
+
+    def __count(self, conversation: str) -> int:
+        if conversation not in self.__saved:
+            row = self.__db.execute('SELECT COALESCE(MAX(position) + 1, 0) FROM records WHERE conversation = ?',
+                                    (conversation,)).fetchone()
+            self.__saved[conversation] = row[0]
+        return self.__saved[conversation]
+
+    def append(self, conversation: str, records):
+        '''This method appends the records (dicts) to the conversation.'''
+        with self.__lock:
+            start = self.__count(conversation)
+            now = time.time()
+            self.__db.executemany('INSERT INTO records (conversation, position, time, data) VALUES (?, ?, ?, ?)',
+                                  [(conversation, start + i, now, json.dumps(record, default=str))
+                                   for i, record in enumerate(records)])
+            self.__db.commit()
+            self.__saved[conversation] = start + len(records)
+
+    def sync(self, conversation: str, records: list):
+        '''This method appends the records of the list which are not stored yet,
+        i.e. the list is the whole conversation, which only grows (e.g. agent.messages).'''
+        with self.__lock:
+            new = records[self.__count(conversation):]
+        if new:
+            self.append(conversation, new)
+
+    def load(self, conversation: str) -> list:
+        '''This method returns the records of the conversation, in order.'''
+        with self.__lock:
+            rows = self.__db.execute('SELECT data FROM records WHERE conversation = ? ORDER BY position',
+                                     (conversation,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def conversations(self) -> list:
+        '''This method returns the names of the stored conversations.'''
+        with self.__lock:
+            return [row[0] for row in self.__db.execute('SELECT DISTINCT conversation FROM records ORDER BY conversation')]
+
+    def export(self, conversation: str, filename: str):
+        '''This method writes the conversation to an Excel (.xlsx), CSV (.csv) or HTML (.html) file.'''
+        df = pd.DataFrame(self.load(conversation))
+        if os.path.dirname(filename) != "":
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if filename.endswith('.csv'):
+            df.to_csv(filename, index=False)
+        elif filename.endswith('.html'):
+            df.to_html(filename, index=False)
+        else:
+            df.to_excel(filename, index=False)
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="List or export the stored conversations.")
+    parser.add_argument("--path", type=str, default='results/conversations.sqlite', help="The store file.")
+    parser.add_argument("--list", action="store_true", help="List the stored conversations.")
+    parser.add_argument("--export", type=str, default="", help="The conversation to export.")
+    parser.add_argument("--output", type=str, default="", help="The file to export to (.xlsx, .csv or .html).")
+    args = parser.parse_args()
+
+    store = ConversationStore(args.path)
+    if args.list:
+        for name in store.conversations():
+            print(name)
+    if args.export:
+        store.export(args.export, args.output or f"{args.export.replace('/', '_')}.xlsx")
+        print(f"Exported {args.export}")
@@ -0,0 +1,121 @@
+# Diagnostics of gcc, parsed from -fdiagnostics-format=json
+#
+# gcc prints the diagnostics of the compiler as one JSON array per line;
+# the linker (e.g. an undefined reference) still prints plain text lines,
+# and so does a gcc which does not accept the JSON flag (file:line:column: ...).
+# All become Diagnostic records, which are rendered into a compact message:
+# only the errors, each once, with the failing lines of the code.
+import json
+import re
+
+# the kinds of gcc diagnostics which fail the compilation
+ERROR_KINDS = ('error', 'fatal error', 'sorry, unimplemented', 'internal compiler error')
+
+# a diagnostic of gcc as plain text: file:line:column: kind: message
+TEXT_LINE = re.compile(r'^(?P<file>[^:]+):(?P<line>\d+):(?P<column>\d+): '
+                       r'(?P<kind>fatal error|error|warning|note|sorry, unimplemented|internal compiler error): '
+                       r'(?P<message>.*)$')
+
+
+class Diagnostic:
+    '''This class is one diagnostic of gcc or of the linker.
+    file, line and column are None if it has no location (e.g. the linker),
+    fixits are the changes gcc suggests, as (line, column, next column, text).'''
+
+    def __init__(self, severity, message, file=None, line=None, column=None, fixits=(), notes=()):
+        self.severity = severity        # "error", "warning", "note", ...
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+        self.fixits = tuple(fixits)
+        self.notes = tuple(notes)       # the messages of the notes which belong to it
+
+    def key(self):
+        return (self.severity, self.message, self.file, self.line, self.column)
+
+    def is_error(self) -> bool:
+        return self.severity in ERROR_KINDS
+
+    def __repr__(self):
+        return f'Diagnostic({self.severity!r}, {self.message!r}, {self.file!r}, {self.line!r}, {self.column!r})'
+
+
+def _from_json(item) -> Diagnostic:
+    caret = item["locations"][0].get("caret", {}) if item.get("locations") else {}
+    fixits = []
+    for fixit in item.get("fixits", []):
+        start, end = fixit.get("start", {}), fixit.get("next", {})
+        fixits.append((start.get("line"), start.get("column"), end.get("column"), fixit.get("string", "")))
+    return Diagnostic(item.get("kind", "error"), item.get("message", ""),
+                      caret.get("file"), caret.get("line"), caret.get("column"), fixits,
+                      [child.get("message", "") for child in item.get("children", [])])
+
+
+def parse(stderr: str) -> list:
+    '''This function parses the stderr of gcc into Diagnostic records, without duplicates.'''
+    records = []
+    seen = set()
+    for text in stderr.splitlines():
+        text = text.strip()
+        if not text:
+            continue
+        parsed = None
+        if text.startswith('['):
+            try:
+                parsed = [_from_json(item) for item in json.loads(text)]
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                parsed = None
+        if parsed is None and TEXT_LINE.match(text):
+            # gcc without the JSON flag
+            match = TEXT_LINE.match(text)
+            parsed = [Diagnostic(match['kind'], match['message'], match['file'],
+                                 int(match['line']), int(match['column']))]
+        if parsed is None:
+            # a line of the linker or of the gcc driver
+            severity = "error" if 'error' in text or 'undefined reference' in text else "note"
+            parsed = [Diagnostic(severity, text)]
+        for record in parsed:
+            if record.key() not in seen:
+                seen.add(record.key())
+                records.append(record)
+    return records
+
+
+def has_errors(records) -> bool:
+    return any(record.is_error() for record in records)
+
+
+def _fixit_text(line, column, next_column, text) -> str:
+    if column == next_column:
+        return f"insert '{text}' at line {line}, column {column}"
+    if text == "":
+        return f"remove columns {column}-{next_column - 1} of line {line}"
+    return f"replace columns {column}-{next_column - 1} of line {line} with '{text}'"
+
+
+def render(records, code: str, context=1, max_errors=10) -> str:
+    '''This function describes the errors in a few lines: for every error
+    its location, message and suggested fixes, and the failing line
+    of the code with context lines around it.'''
+    lines = code.split('\n')
+    errors = [record for record in records if record.is_error()]
+    parts = []
+    for record in errors[:max_errors]:
+        if record.line is None:
+            # a line of the linker, as it printed it
+            parts.append(record.message)
+            continue
+        parts.append(f"line {record.line}, column {record.column}: {record.severity}: {record.message}")
+        parts.extend(f"  note: {note}" for note in record.notes)
+        parts.extend(f"  fix: {_fixit_text(*fixit)}" for fixit in record.fixits)
+        # the lines of the code, unless the error is in a header
+        if record.file is not None and record.file.endswith('.h'):
+            continue
+        for number in range(max(1, record.line - context), min(len(lines), record.line + context) + 1):
+            parts.append(f"{number:5} | {lines[number - 1]}")
+            if number == record.line and record.column:
+                parts.append(f"      | {' ' * (record.column - 1)}^")
+    if len(errors) > max_errors:
+        parts.append(f"... and {len(errors) - max_errors} more errors")
+    return '\n'.join(parts)
@@ -3,13 +3,23 @@
 import argparse
 from tqdm import tqdm  # Import tqdm for progress bar
 from agent import AgentAI
+import conversationstore
+import writebehind
+import runlog
 
 def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Run the AgentAI with a prompt.")
     parser.add_argument("--prompt", type=str, required=True, help="The prompt to send to the agent.")
+    parser.add_argument("--store", type=str, default="results/conversations.sqlite", help="SQLite file the conversations are appended to.")
     args = parser.parse_args()
 
+    # every iteration only appends the new messages, the Excel file is written once at the end
+    store = conversationstore.ConversationStore(args.store)
+    conversation = f'{runlog.get_log().run_id}/programmer'
+    # the writes are done in the background, the next request does not wait for them
+    writer = writebehind.get_writer()
+
     # Create an instance of the Agent class
     agentDesigner = AgentAI(server_address="http://deeperthought.cse.chalmers.se", 
                               model_name="llama3.2:1b",
@@ -35,11 +45,11 @@ def main():
         #print("\n\n:::::::::::::::::::Designer Response::::::::::::::::::")
         #print(responseDesigner[:100])
 
-        # once every 10 times save to excel
-        if i % 5 == 0:
-            agentProgrammer.save_to_excel("results/programmer_conversation_hackathon.xlsx")
+        # append the new messages to the store
+        writer.submit(conversation, store.sync, conversation, list(agentProgrammer.messages))
 
     # save the final conversation to excel
-    agentProgrammer.save_to_excel("results/programmer_conversation_hackathon.xlsx")
+    writer.flush()
+    store.export(conversation, "results/programmer_conversation_hackathon.xlsx")
 if __name__ == "__main__":
     main()
@@ -4,6 +4,14 @@ import argparse
 from agentPy import AgentAIPy
 from agent import AgentAI
 from tqdm import tqdm
+import transport
+from responsecache import ResponseCache
+from endpoints import EndpointPool
+import execcache
+import warmpool
+import runlog
+import conversationstore
+import writebehind
 
 MAX_ITERATIONS = 100  # Set the maximum number of iterations
 
@@ -11,15 +19,53 @@ def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Run the AgentAI with a prompt.")
     parser.add_argument("--prompt", type=str, required=True, help="The prompt to send to the agent.")
+    parser.add_argument("--cache", type=str, default="", help="SQLite file to cache the answers of the models in.")
+    parser.add_argument("--cache-random", action="store_true", help="Cache also the answers with temperature > 0.")
+    parser.add_argument("--balance", action="store_true", help="Balance the requests between all servers serving the model.")
+    parser.add_argument("--hedge", action="store_true", help="With --balance, resend slow requests to another server.")
+    parser.add_argument("--exec-cache", type=str, default="", help="SQLite file to cache the results of the executed code in.")
+    parser.add_argument("--warm", action="store_true", help="Run the generated code in a warm python interpreter.")
+    parser.add_argument("--context-tokens", type=int, default=0, help="Token budget of one request, e.g. 8000; by default the whole conversation is sent.")
+    parser.add_argument("--run-log", type=str, default=None, help="JSON Lines file to log the events of the run in, e.g. logs/run.jsonl; no log by default.")
+    parser.add_argument("--store", type=str, default="results/conversations.sqlite", help="SQLite file the conversations are appended to.")
     args = parser.parse_args()
 
+    # the events of all agents go to one buffered log
+    runlog.set_log(runlog.RunLog(args.run_log))
+
+    # every iteration only appends the new messages, the Excel file is written once at the end
+    store = conversationstore.ConversationStore(args.store)
+    conversation = f'{runlog.get_log().run_id}/programmer'
+    # the writes are done in the background, the next request does not wait for them
+    writer = writebehind.get_writer()
+
+    # answer repeated requests from the local cache instead of the server
+    if args.cache:
+        transport.get_transport().cache = ResponseCache(args.cache, cache_random=args.cache_random)
+
+    # do not run the same generated code again
+    if args.exec_cache:
+        execcache.set_cache(execcache.ExecutionCache(args.exec_cache))
+
+    # do not pay the start of python3 for every run of the generated code
+    if args.warm:
+        warmpool.set_pool(warmpool.WarmPool())
+
+    # send every request to the least loaded server which serves the model
+    if args.balance:
+        transport.get_transport().pool = EndpointPool()
+        transport.get_transport().pool.start()
+        transport.get_transport().hedge = args.hedge
+
     # Create an instance of the Agent class
     agentDesigner = AgentAI(server_address="http://lazythought.cse.chalmers.se", 
                               model_name="llama3.2:3b",
+                              context_tokens=args.context_tokens,
                               my_role="You are a Python designer. You will be given a task and you will respond with design suggestions to solve or the task.")
     
     agentProgrammer = AgentAIPy(server_address="http://lazythought.cse.chalmers.se", 
                             model_name="llama3.2:3b",
+                            context_tokens=args.context_tokens,
                             my_role=(
                                 "You are a Python programmer."
                                 " Return ONLY Python code wrapped in a markdown code block."
@@ -28,6 +74,7 @@ def main():
     
 
     for i in tqdm(range(MAX_ITERATIONS), desc="Processing iterations"):
+        runlog.get_log().set_iteration(i)
         # if this is the first iteration, then we use the original prompt
         if i == 0:
             # Get the response from the programmer agent
@@ -41,8 +88,11 @@ def main():
             
             responseDesigner = agentDesigner.get_response(responseProgrammer)
 
-        # save to excel to get the conversation saved somewhere
-        agentProgrammer.save_to_excel("results/programmer_conversation_hackathon.xlsx")
+        # append the new messages to the store to get the conversation saved somewhere
+        writer.submit(conversation, store.sync, conversation, list(agentProgrammer.messages))
+
+    writer.flush()
+    store.export(conversation, "results/programmer_conversation_hackathon.xlsx")
  
     
 if __name__ == "__main__":
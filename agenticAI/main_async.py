@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# run many designer/programmer conversations at the same time on one event loop
+import argparse
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+import agentAsync
+from agentAsync import AsyncAgentAI, AsyncAgentAIC, AsyncAgentAIPy
+
+MAX_ITERATIONS = 5  # Set the maximum number of iterations per conversation
+
+
+async def run_conversation(task_id: int, prompt: str, args) -> str:
+    '''This function runs one designer/programmer conversation for one task.
+    The conversations run concurrently; they only wait for each other
+    when a server already has the maximum number of requests in flight.'''
+
+    if args.language == "c":
+        agentProgrammer = AsyncAgentAIC(server_address=args.programmer_server,
+                                        model_name=args.programmer_model,
+                                        my_role="You are a C programmer. You respond with the code in C to solve the task. No comments or explanations")
+    else:
+        agentProgrammer = AsyncAgentAIPy(server_address=args.programmer_server,
+                                         model_name=args.programmer_model,
+                                         my_role=(
+                                             "You are a Python programmer."
+                                             " Return ONLY Python code wrapped in a markdown code block."
+                                             " No comments or explanations."
+                                         ))
+
+    agentDesigner = AsyncAgentAI(server_address=args.designer_server,
+                                 model_name=args.designer_model,
+                                 my_role=f"You are a {'C' if args.language == 'c' else 'Python'} designer. You will be given a task and you will respond with design suggestions to solve or the task.")
+
+    async def programmer(prompt):
+        if args.language == "c":
+            return await agentProgrammer.start(3, prompt)
+        return await agentProgrammer.get_response(prompt)
+
+    for i in range(args.iterations):
+        # if this is the first iteration, then we use the original prompt
+        if i == 0:
+            responseProgrammer = await programmer(prompt)
+            responseDesigner = await agentDesigner.get_response(f'How to improve this code: {responseProgrammer}')
+        else:
+            # for all the other iterations, we only match the responses from one another
+            responseProgrammer = await programmer(responseDesigner)
+            responseDesigner = await agentDesigner.get_response(responseProgrammer)
+
+    # save the conversation without blocking the other conversations
+    filename = os.path.join(args.output_dir, f'programmer_conversation_{task_id}.xlsx')
+    await asyncio.to_thread(agentProgrammer.save_to_excel, filename)
+    return filename
+
+
+async def run_all(prompts: list, args) -> list:
+    '''This function is the coordinator: it runs all conversations on one event loop.'''
+
+    servers = {args.programmer_server, args.designer_server}
+    for server in servers:
+        agentAsync.set_endpoint_concurrency(server, args.concurrency)
+
+    # the requests run on worker threads, one for every request that can be in flight
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=args.concurrency * len(servers)))
+
+    results = []
+    tasks = [asyncio.create_task(run_conversation(i, prompt, args)) for i, prompt in enumerate(prompts)]
+    for finished in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing tasks"):
+        try:
+            results.append(await finished)
+        except Exception as e:
+            # one broken conversation must not stop the others
+            print(f"Conversation failed: {e}")
+    return results
+
+
+def main():
+    # Parse command-line arguments
+    parser = argparse.ArgumentParser(description="Run many AgentAI conversations concurrently.")
+    parser.add_argument("--prompts", type=str, required=True, help="File with one task (prompt) per line.")
+    parser.add_argument("--language", choices=["c", "python"], default="python", help="Language of the programs.")
+    parser.add_argument("--iterations", type=int, default=MAX_ITERATIONS, help="Designer/programmer rounds per task.")
+    parser.add_argument("--concurrency", type=int, default=agentAsync.DEFAULT_ENDPOINT_CONCURRENCY,
+                        help="Maximum number of requests in flight per server.")
+    parser.add_argument("--programmer-server", type=str, default="http://lazythought.cse.chalmers.se")
+    parser.add_argument("--programmer-model", type=str, default="llama3.2:3b")
+    parser.add_argument("--designer-server", type=str, default="http://lazythought.cse.chalmers.se")
+    parser.add_argument("--designer-model", type=str, default="llama3.2:3b")
+    parser.add_argument("--output-dir", type=str, default="results")
+    args = parser.parse_args()
+
+    with open(args.prompts, 'r') as f:
+        prompts = [line.strip() for line in f if line.strip() != ""]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    asyncio.run(run_all(prompts, args))
+
+
+if __name__ == "__main__":
+    main()
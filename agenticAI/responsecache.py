@@ -0,0 +1,56 @@
+# Cache of the answers of the models
+#
+# python3 responsecache.py --stats     shows how many answers are cached
+# python3 responsecache.py --clear     removes all cached answers
+import hashlib
+import json
+from lrustore import LRUStore
+
+
+class ResponseCache(LRUStore):
+    '''This class is a persistent cache of the answers of the models.
+    It is stored in a local SQLite database, so the answers survive between runs.
+
+    The key is a hash of the endpoint, the model, the full list of messages,
+    the temperature and max_tokens, i.e. everything that decides the answer,
+    and whether the answer was cut off after its first code block.
+    Only deterministic requests (temperature 0) are cached, unless
+    cache_random is set; then a re-run replays the first answer.
+    When the stored answers grow over max_bytes, the least recently used
+    ones are removed.'''
+
+    table = 'responses'
+    columns = (('content', 'TEXT NOT NULL'),)
+    description = 'the answers of the models'
+    noun = 'answers'
+
+    def __init__(self, path='cache/llm_responses.sqlite', max_bytes=512 * 1024 * 1024, cache_random=False):
+        super().__init__(path, max_bytes)
+        self.cache_random = cache_random    # cache requests with temperature > 0 too
+
+    @staticmethod
+    def key(url: str, data: dict, stop_at_code_block=False) -> str:
+        '''This method computes the key of a chat request; stop_at_code_block
+        tells that the answer is cut off after the code (see Transport.chat).'''
+        request = {
+            "endpoint": url,
+            "model": data.get("model"),
+            "messages": data.get("messages"),
+            "temperature": data.get("temperature"),
+            "max_tokens": data.get("max_tokens"),
+        }
+        # the repair candidates differ only in the seed
+        if "seed" in data:
+            request["seed"] = data["seed"]
+        # a cut-off answer must not be replayed for a request of the full answer
+        if stop_at_code_block:
+            request["stop_at_code_block"] = True
+        return hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def cacheable(self, data: dict) -> bool:
+        '''This method tells if the answer to the request can be cached.'''
+        return self.cache_random or data.get("temperature", 0.0) == 0.0
+
+
+if __name__ == '__main__':
+    ResponseCache.main()
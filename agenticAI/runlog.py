@@ -0,0 +1,155 @@
+# Structured log of the runs of the agents
+#
+# Every event is one JSON line, e.g.
+#   {"time": 1700000000.0, "run": "3f2a...", "agent": "AgentCompiler-2", "iteration": 4,
+#    "event": "compilation", "result": "Compilation successful"}
+# The events are buffered in memory and written by a background thread,
+# so an agent never waits for the disk; the file is rotated when it grows
+# over max_bytes (run.jsonl -> run.jsonl.1 -> ... -> run.jsonl.<backups>).
+# The log is off unless a file is given, e.g. with --run-log logs/run.jsonl.
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+
+class RunLog:
+    '''This class is a buffered JSON Lines event log, shared by all agents of a run.
+    The events are written every flush_seconds, or as soon as max_buffered
+    of them are waiting, by one background thread.
+    With path=None the log is off: it has a run id, but the events are dropped.'''
+
+    def __init__(self, path=None, max_bytes=16 * 1024 * 1024, backups=3,
+                 flush_seconds=1.0, max_buffered=1000, run_id=None):
+        self.path = path                        # the log file
+        self.max_bytes = max_bytes              # size at which the file is rotated
+        self.backups = backups                  # rotated files which are kept
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self.run_id = run_id or uuid.uuid4().hex[:12]   # the id of this run in all its events
+        self.iteration = None                   # the current iteration of the run, see set_iteration
+        self.__buffer = []
+        self.__lock = threading.Lock()          # guards the buffer
+        self.__write_lock = threading.Lock()    # one writer of the file at a time
+        self.__wakeup = threading.Event()
+        self.__closed = False
+        self.__thread = None
+
+        if path is None:
+            return
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.__thread = threading.Thread(target=self.__flush_loop, daemon=True, name='runlog')
+        self.__thread.start()
+
+    def set_iteration(self, iteration):
+        '''This method sets the iteration of the run, which is recorded in the next events.'''
+        self.iteration = iteration
+
+    def event(self, event: str, agent=None, **fields):
+        '''This method records an event of the agent (an object, or its id) with its fields.
+        It only puts the event into the buffer.'''
+        if self.path is None:
+            return
+        record = {
+            "time": time.time(),
+            "run": self.run_id,
+            "agent": agent if agent is None or isinstance(agent, str) else agent_id(agent),
+            "iteration": self.iteration,
+            "event": event,
+            **fields,
+        }
+        with self.__lock:
+            self.__buffer.append(record)
+            full = len(self.__buffer) >= self.max_buffered
+        if full:
+            self.__wakeup.set()
+
+    def flush(self):
+        '''This method writes the buffered events to the file.'''
+        with self.__write_lock:
+            with self.__lock:
+                records, self.__buffer = self.__buffer, []
+            if not records:
+                return
+            data = ''.join(json.dumps(record, default=str) + '\n' for record in records).encode('utf-8')
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+                    self.__rotate()
+                with open(self.path, 'ab') as f:
+                    f.write(data)
+            except OSError as e:
+                print(f"Cannot write the run log {self.path}: {e}")
+
+    def __rotate(self):
+        '''This method moves the file to <path>.1, <path>.1 to <path>.2 and so on.'''
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{i}'):
+                os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+    def __flush_loop(self):
+        while not self.__closed:
+            self.__wakeup.wait(self.flush_seconds)
+            self.__wakeup.clear()
+            self.flush()
+
+    def close(self):
+        '''This method stops the background thread and writes the remaining events.'''
+        self.__closed = True
+        if self.__thread is None:
+            return
+        self.__wakeup.set()
+        self.__thread.join()
+        self.flush()
+
+
+# the ids of the agents, e.g. "AgentCompiler-2"
+_agent_ids = weakref.WeakKeyDictionary()
+_agent_numbers = itertools.count(1)
+
+
+def agent_id(agent) -> str:
+    '''This function returns the id of the agent in the events, which is the same
+    for the whole life of the agent.'''
+    try:
+        return _agent_ids[agent]
+    except KeyError:
+        return _agent_ids.setdefault(agent, f'{type(agent).__name__}-{next(_agent_numbers)}')
+
+
+# the log of the process, created at the first event, see set_log
+_shared_log = None
+_shared_log_lock = threading.Lock()
+
+
+def get_log() -> RunLog:
+    '''This function returns the run log of the process,
+    which is off (see RunLog) until set_log gives it a file.'''
+    global _shared_log
+    with _shared_log_lock:
+        if _shared_log is None:
+            _shared_log = RunLog()
+            atexit.register(_shared_log.close)
+        return _shared_log
+
+
+def set_log(log: RunLog):
+    '''This function changes the run log of the process, e.g. to another file.'''
+    global _shared_log
+    with _shared_log_lock:
+        if _shared_log is not None and _shared_log is not log:
+            _shared_log.close()
+        _shared_log = log
+        atexit.register(log.close)
+
+
+def event(event: str, agent=None, **fields):
+    '''This function records an event in the run log of the process, see RunLog.event.'''
+    get_log().event(event, agent, **fields)
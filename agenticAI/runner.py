@@ -0,0 +1,226 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+import traceback
+import warnings
+import execcache
+import warmpool
+
+
+# a program which prints more than this to stdout or stderr is killed
+DEFAULT_OUTPUT_LIMIT = 4 * 1024 * 1024
+
+# a program which uses no CPU time and prints nothing for this many seconds is stopped
+DEFAULT_STALL_SECONDS = 3.0
+
+
+class BoundedCapture:
+    '''This class keeps the output of a program in constant memory:
+    the first and the last bytes up to keep bytes in total
+    (the end of a traceback is where the error is), and how many bytes came.'''
+
+    def __init__(self, keep=8192):
+        self.head_size = keep // 4
+        self.tail_size = keep - self.head_size
+        self.head = bytearray()
+        self.tail = bytearray()             # the last tail_size bytes after the head
+        self.total = 0
+
+    def feed(self, chunk: bytes):
+        self.total += len(chunk)
+        if len(self.head) < self.head_size:
+            taken = self.head_size - len(self.head)
+            self.head += chunk[:taken]
+            chunk = chunk[taken:]
+        self.tail += chunk[-self.tail_size:]
+        if len(self.tail) > self.tail_size:
+            del self.tail[:len(self.tail) - self.tail_size]
+
+    def feed_file(self, path: str):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                self.feed(chunk)
+
+    def text(self) -> str:
+        cut = self.total - len(self.head) - len(self.tail)
+        data = bytes(self.head) + (f'\n... [{cut} bytes cut] ...\n'.encode('utf-8') if cut > 0 else b'') + bytes(self.tail)
+        return data.decode('utf-8', errors='replace')
+
+
+def run_program(executable: str, script, source, flags=(), stdin=None, timeout=10, max_output=8192,
+                output_limit=DEFAULT_OUTPUT_LIMIT, stall_seconds=DEFAULT_STALL_SECONDS) -> dict:
+    '''This function runs the script (which contains the source) with the executable,
+    e.g. run_program('python3', 'code_temp.py', code), or the executable alone if script is None,
+    e.g. run_program(os.path.join(workdir, 'a.out'), None, None).
+    It returns a dict with
+        status          "exited", "timeout", "output limit", "waiting for input" or "stalled"
+        returncode      the exit code, or -N if the program was killed by the signal N
+        signal          the name of that signal, e.g. "SIGSEGV", or None
+        stdout, stderr  the output, at most max_output bytes of its beginning and end
+        wall_time, user_time, sys_time  in seconds
+        max_rss_kb      the peak resident memory in KB
+    The resource usage comes from wait4, so it covers the program and
+    the processes it waited for. Linux counts the memory of the parent at
+    the fork in the peak RSS, so the warm interpreters (a small parent)
+    measure it more precisely than a new process of a large caller.
+    The output is read as it comes, and a program which prints more than
+    output_limit bytes is killed, so a run takes constant memory.
+    The stdin (a string) is the scripted input of the program, after it the
+    program reads the end of the file. Without stdin (None), a program which
+    waits for input is stopped at once instead of waiting for the timeout,
+    as is a program which uses no CPU time and prints nothing for
+    stall_seconds (None turns it off).
+
+    If the execution cache of the process is on, the same source run with
+    the same interpreter, flags, stdin, timeout and limits is not run again
+    (a program without a source, e.g. a binary, is not cached).
+    If the warm pool of the process is on, python scripts are run
+    by its warm interpreters instead of a new python3 process.'''
+    cache = execcache.get_cache() if source is not None else None
+    key = None
+    if cache is not None:
+        key = cache.key(source, executable, flags, stdin, timeout, max_output, output_limit, stall_seconds)
+        cached = cache.get(key)
+        if cached is not None:
+            cached["cached"] = True
+            return cached
+
+    pool = warmpool.get_pool()
+    result = None
+    if pool is not None and executable == pool.executable and not flags and script is not None:
+        try:
+            captures = (BoundedCapture(max_output), BoundedCapture(max_output))
+            reply = pool.run(script, captures, stdin, timeout, output_limit, stall_seconds)
+            result = _result(_status(reply["stopped"], captures, output_limit), reply["returncode"],
+                             captures, reply)
+        except (OSError, RuntimeError) as e:
+            print(f"Warm interpreter failed, starting {executable}: {e}")
+
+    if result is None:
+        result = _run_subprocess([executable, *flags] + ([script] if script is not None else []),
+                                 stdin, timeout, max_output, output_limit, stall_seconds)
+    if cache is not None:
+        cache.put(key, result)
+    result["cached"] = False
+    return result
+
+
+def check_python(source: str, filename='code_temp.py'):
+    '''This function compiles the python source in this process, without running it,
+    so a syntax error is found in milliseconds instead of starting python3.
+    It returns None if the syntax is right, otherwise a failed run (as run_program)
+    with the error in stderr, as python3 would print it.'''
+    start = time.monotonic()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            compile(source, filename, 'exec', dont_inherit=True)
+        return None
+    except (SyntaxError, ValueError) as e:
+        message = ''.join(traceback.format_exception_only(type(e), e))
+    return {
+        "status": "exited",
+        "returncode": 1,
+        "signal": None,
+        "stdout": "",
+        "stderr": message,
+        "wall_time": time.monotonic() - start,
+        "user_time": 0.0,
+        "sys_time": 0.0,
+        "max_rss_kb": 0,
+        "cached": False,
+    }
+
+
+def summary(result: dict) -> str:
+    '''This function describes the run in one line, e.g. for the progress output.'''
+    if result["status"] == "timeout":
+        outcome = "timed out"
+    elif result["status"] == "output limit":
+        outcome = "killed for too much output"
+    elif result["status"] in ("waiting for input", "stalled"):
+        outcome = f'stopped, {result["status"]}'
+    elif result.get("signal"):
+        outcome = f'killed by {result["signal"]}'
+    else:
+        outcome = f'exit code {result["returncode"]}'
+    return (f'{outcome}, {result["wall_time"]:.3f} s wall, {result.get("user_time", 0.0):.3f} s user, '
+            f'{result.get("sys_time", 0.0):.3f} s sys, {result.get("max_rss_kb", 0)} KB max RSS')
+
+
+def _run_subprocess(command, stdin, timeout, max_output, output_limit, stall_seconds):
+    '''This function runs the command in a new process group
+    and collects its resource usage with wait4.'''
+    start = time.monotonic()
+    process = subprocess.Popen(command,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               start_new_session=True)
+    captures = (BoundedCapture(max_output), BoundedCapture(max_output))
+
+    def read(capture, stream):
+        fd = stream.fileno()
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            capture.feed(chunk)
+            if capture.total > output_limit and capture.total - len(chunk) <= output_limit:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        stream.close()
+
+    threads = [threading.Thread(target=read, args=(captures[0], process.stdout), daemon=True),
+               threading.Thread(target=read, args=(captures[1], process.stderr), daemon=True)]
+    for thread in threads:
+        thread.start()
+    # the writer closes the pipe after the scripted input; without one
+    # the pipe stays open, so a program which reads it waits for input
+    stdin_fd = os.dup(process.stdin.fileno())
+    process.stdin.close()
+    writer = warmpool.feed_stdin(stdin_fd, None if stdin is None else stdin.encode('utf-8'))
+    watchdog = warmpool.Watchdog(process.pid,
+                                 lambda: captures[0].total + captures[1].total,
+                                 lambda: not writer.is_alive(),
+                                 stall_seconds)
+
+    status, rusage, reason = warmpool.wait(process.pid, timeout, watchdog)
+    # wait4 reaped the process, so Popen must not wait for it again
+    process.returncode = os.waitstatus_to_exitcode(status)
+    for thread in threads + [writer]:
+        # the killed program may have left children which keep the pipes open
+        thread.join(timeout=1)
+    if stdin is None:
+        os.close(stdin_fd)
+    usage = {
+        "wall_time": time.monotonic() - start,
+        "user_time": rusage.ru_utime,
+        "sys_time": rusage.ru_stime,
+        "max_rss_kb": rusage.ru_maxrss,
+    }
+    return _result(_status(reason, captures, output_limit), process.returncode, captures, usage)
+
+
+def _status(reason, captures, output_limit):
+    if any(capture.total > output_limit for capture in captures):
+        return "output limit"
+    return reason or "exited"
+
+
+def _result(status, returncode, captures, usage):
+    return {
+        "status": status,
+        "returncode": returncode,
+        "signal": signal.Signals(-returncode).name if returncode is not None and returncode < 0 else None,
+        "stdout": captures[0].text(),
+        "stderr": captures[1].text(),
+        "wall_time": usage["wall_time"],
+        "user_time": usage["user_time"],
+        "sys_time": usage["sys_time"],
+        "max_rss_kb": usage["max_rss_kb"],
+    }
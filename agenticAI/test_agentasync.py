@@ -0,0 +1,42 @@
+import asyncio
+import agentAsync
+from agentAsync import AsyncAgentInterpreter
+
+URL = 'http://localhost:11434/api/chat'
+
+
+def test_endpoint_limit_works_on_a_second_event_loop():
+    agentAsync.set_endpoint_concurrency(URL, 2)
+
+    async def use_limit():
+        async with agentAsync.endpoint_limit(URL):
+            await asyncio.sleep(0)
+        return agentAsync.endpoint_limit(URL)
+
+    first = asyncio.run(use_limit())
+    second = asyncio.run(use_limit())
+    assert first is not second
+    assert second._value == 2
+
+
+def interpret(code):
+    agentInterpreter = AsyncAgentInterpreter(server_address=URL, model_name="llama3.2", timeout_seconds=10)
+    return asyncio.run(agentInterpreter.interpret_code(code)), agentInterpreter.last_run
+
+
+def test_interpretation_is_successful():
+    result, run = interpret('print("hello")\n')
+    assert result == "Interpretation successful"
+    assert run["stdout"].strip() == "hello"
+
+
+def test_syntax_error_is_found_without_running_python():
+    result, run = interpret('print("hello"\n')
+    assert result.startswith("Interpretation error")
+    assert run["user_time"] == 0.0
+
+
+def test_program_waiting_for_input_is_stopped():
+    result, run = interpret('input()\n')
+    assert "waits for input" in result
+    assert run["wall_time"] < 5
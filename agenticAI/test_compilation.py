@@ -0,0 +1,92 @@
+import os
+import subprocess
+import threading
+import pytest
+import compilation
+
+WORKING = '#include <stdio.h>\nint main(){\n  puts("hi");\n  return 0;\n}\n'
+FAILING = 'int main(){\n  return 0\n}\n'
+
+
+@pytest.fixture
+def gcc_calls(monkeypatch):
+    calls = []
+    real_run = subprocess.run
+
+    def run(args, *rest, **kwargs):
+        if args[0] == 'gcc' and '-fsyntax-only' not in args:
+            calls.append(args)
+        return real_run(args, *rest, **kwargs)
+
+    monkeypatch.setattr(compilation.subprocess, 'run', run)
+    return calls
+
+
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_binary_is_run_without_compiling_again(gcc_calls, tmp_path, in_memory):
+    compilation.set_in_memory(in_memory)
+    try:
+        result, binary = compilation.compile_binary(WORKING, str(tmp_path))
+        assert result == "Compilation successful"
+        run = compilation.run_binary(binary)
+        binary.close()
+    finally:
+        compilation.set_in_memory(False)
+    assert run['stdout'].strip() == 'hi'
+    assert len(gcc_calls) == 1
+
+
+def test_failed_compilation_has_no_binary(tmp_path):
+    result, binary = compilation.compile_binary(FAILING, str(tmp_path))
+    assert result.startswith("Compilation error")
+    assert binary is None
+
+
+def test_first_compiling_returns_the_binary_of_the_winner(gcc_calls):
+    answers = [f'```c\n{FAILING}```', f'```c\n{WORKING}```']
+    answer, code, result, binary = compilation.first_compiling(lambda i, cancel: answers[i], 2)
+    assert result == "Compilation successful"
+    assert code == WORKING.strip()
+    assert compilation.run_binary(binary)['stdout'].strip() == 'hi'
+    binary.close()
+    # the winner's directory goes away with its binary
+    assert not os.path.exists(binary.path)
+    assert len(gcc_calls) == 1
+
+
+def test_first_compiling_cancels_the_candidates_which_lost():
+    stopped = threading.Event()
+
+    def request_candidate(i, cancel):
+        if i == 0:
+            return f'```c\n{WORKING}```'
+        # a slow answer, which stops when it is cancelled
+        if cancel.wait(5):
+            stopped.set()
+        return None
+
+    answer, code, result, binary = compilation.first_compiling(request_candidate, 2)
+    binary.close()
+    assert result == "Compilation successful"
+    assert stopped.wait(1)
+
+
+def test_first_compiling_skips_a_candidate_which_fails():
+    def request_candidate(i, cancel):
+        if i == 0:
+            raise ConnectionError("the server went away")
+        return f'```c\n{WORKING}```'
+
+    answer, code, result, binary = compilation.first_compiling(request_candidate, 2)
+    assert result == "Compilation successful"
+    binary.close()
+
+
+def test_c_program_reading_to_the_end_of_the_scripted_input(tmp_path):
+    code = ('#include <stdio.h>\nint main(){\n  int x, sum = 0;\n'
+            '  while (scanf("%d", &x) != EOF) sum += x;\n  printf("%d\\n", sum);\n  return 0;\n}\n')
+    result, binary = compilation.compile_binary(code, str(tmp_path))
+    run = compilation.run_binary(binary, stdin='1 2\n3\n')
+    binary.close()
+    assert run["status"] == "exited"
+    assert run["stdout"] == "6\n"
@@ -0,0 +1,48 @@
+import os
+import pytest
+import compilation
+import compilecache
+
+FAILING = '#include <stdio.h>\nint main(){\n  int x = 1\n  printf("%d", x);\n  return 0;\n}\n'
+WORKING = '#include <stdio.h>\nint main(){\n  puts("hi");\n  return 0;\n}\n'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = compilecache.CompileCache(str(tmp_path / 'compilations.sqlite'))
+    compilecache.set_cache(cache)
+    yield cache
+    compilecache.set_cache(None)
+    cache.close()
+
+
+def test_failed_compilation_is_not_replayed_for_moved_lines(cache, tmp_path):
+    first = compilation.compile_c(FAILING, str(tmp_path))
+    assert first.startswith("Compilation error")
+    assert "line 4" in first
+
+    # the same program with one comment line in front of it preprocesses the same
+    moved = compilation.compile_c('// more\n' + FAILING, str(tmp_path))
+    assert "line 5" in moved
+    assert "// more" not in moved
+
+
+def test_failed_compilation_is_found_for_the_same_source(cache, tmp_path):
+    compilation.compile_c(FAILING, str(tmp_path))
+    assert compilation.compile_c(FAILING, str(tmp_path)).startswith("Compilation error")
+    assert cache.hits == 1
+
+
+def test_successful_compilation_is_found_after_preprocessing(cache, tmp_path):
+    assert compilation.compile_c(WORKING, str(tmp_path)) == "Compilation successful"
+    os.remove(os.path.join(tmp_path, 'a.out'))
+
+    assert compilation.compile_c('/* a comment */\n' + WORKING, str(tmp_path)) == "Compilation successful"
+    assert cache.hits == 1
+    # the binary comes from the cache
+    assert os.access(os.path.join(tmp_path, 'a.out'), os.X_OK)
+
+
+def test_key_depends_on_the_flags():
+    assert (compilecache.CompileCache.key(WORKING, 'gcc', ['-O0'])
+            != compilecache.CompileCache.key(WORKING, 'gcc', ['-O2']))
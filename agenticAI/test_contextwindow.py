@@ -0,0 +1,31 @@
+from contextwindow import ContextWindow
+
+CODE = 'def solve():\n    return 42\n' * 20
+
+
+def conversation(latest_code, prompt):
+    return [
+        {"role": "system", "content": "You are a Python programmer."},
+        {"role": "user", "content": "Write a function which returns 42."},
+        {"role": "assistant", "content": "x = 1\n" * 200},
+        {"role": "user", "content": "The designer suggested many things. " * 50},
+        {"role": "assistant", "content": latest_code},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def test_small_conversation_is_sent_as_it_is():
+    messages = conversation(CODE, "Improve it.")
+    assert ContextWindow(100000).select(messages) == messages
+
+
+def test_latest_answer_is_pinned_without_a_code_fence():
+    messages = conversation(CODE, "Improve it.")
+    assert ContextWindow.pinned(messages) == {0, 1, 4, 5}
+
+
+def test_prompt_quoting_code_does_not_replace_the_latest_answer():
+    messages = conversation(CODE, "Here is a snippet:\n```python\nprint(1)\n```\nUse it.")
+    assert 4 in ContextWindow.pinned(messages)
+    selected = ContextWindow(200).select(messages)
+    assert messages[4] in selected
@@ -0,0 +1,28 @@
+import conversationstore
+
+
+def test_sync_appends_only_the_new_messages(tmp_path):
+    path = str(tmp_path / 'conversations.sqlite')
+    store = conversationstore.ConversationStore(path)
+    messages = [{"role": "system", "content": "You are a C programmer."}]
+    store.sync('run/programmer', messages)
+    messages.append({"role": "user", "content": "Write hello world."})
+    store.sync('run/programmer', messages)
+    store.sync('run/programmer', messages)
+    store.close()
+
+    # a new store continues after the stored records
+    store = conversationstore.ConversationStore(path)
+    assert store.load('run/programmer') == messages
+    store.append('run/programmer', [{"role": "assistant", "content": "puts"}])
+    assert len(store.load('run/programmer')) == 3
+    assert store.conversations() == ['run/programmer']
+    store.close()
+
+
+def test_export_to_csv(tmp_path):
+    store = conversationstore.ConversationStore(str(tmp_path / 'conversations.sqlite'))
+    store.append('log', [{"iteration": 0, "role": "programmer"}, {"iteration": 0, "role": "designer"}])
+    store.export('log', str(tmp_path / 'out' / 'log.csv'))
+    store.close()
+    assert (tmp_path / 'out' / 'log.csv').read_text().splitlines() == ['iteration,role', '0,programmer', '0,designer']
@@ -0,0 +1,71 @@
+import subprocess
+import pytest
+import compilation
+import diagnostics
+from execcache import accepts_flag
+
+CODE = 'int main(){\n  int x = 1\n  return x;\n}\n'
+
+
+def gcc_stderr(code, *flags):
+    result = subprocess.run(['gcc', *compilation.GCC_FLAGS, *flags, '-fsyntax-only', '-x', 'c', '-'],
+                            input=code.encode('utf-8'), capture_output=True)
+    return result.stderr.decode()
+
+
+@pytest.mark.skipif(not accepts_flag('gcc', compilation.JSON_DIAGNOSTICS), reason="gcc without JSON diagnostics")
+def test_parse_the_json_of_gcc():
+    stderr = gcc_stderr(CODE, compilation.JSON_DIAGNOSTICS)
+    assert stderr.startswith('[')
+    records = diagnostics.parse(stderr)
+    assert diagnostics.has_errors(records)
+    error = [record for record in records if record.is_error()][0]
+    assert error.line == 3
+    assert "expected" in error.message
+
+
+def test_parse_a_line_of_the_linker():
+    records = diagnostics.parse("/usr/bin/ld: main.o: undefined reference to `foo'\n"
+                                "collect2: error: ld returned 1 exit status\n")
+    assert [record.severity for record in records] == ["error", "error"]
+    assert records[0].line is None
+
+
+def test_parse_removes_duplicates():
+    line = ('[{"kind": "error", "message": "expected \';\'", '
+            '"locations": [{"caret": {"file": "a.c", "line": 3, "column": 3}}]}]')
+    assert len(diagnostics.parse(f'{line}\n{line}\n')) == 1
+
+
+def test_warnings_are_not_errors():
+    line = ('[{"kind": "warning", "message": "unused variable", '
+            '"locations": [{"caret": {"file": "a.c", "line": 2, "column": 7}}]}]')
+    assert not diagnostics.has_errors(diagnostics.parse(line))
+
+
+def test_render_shows_the_failing_line_and_the_fix():
+    line = ('[{"kind": "error", "message": "expected \';\' before \'return\'", '
+            '"locations": [{"caret": {"file": "a.c", "line": 2, "column": 12}}], '
+            '"fixits": [{"start": {"line": 2, "column": 12}, "next": {"line": 2, "column": 12}, "string": ";"}]}]')
+    text = diagnostics.render(diagnostics.parse(line), CODE)
+    assert "line 2, column 12: error" in text
+    assert "fix: insert ';' at line 2, column 12" in text
+    assert "    2 |   int x = 1" in text
+
+
+def test_parse_the_plain_text_of_gcc():
+    records = diagnostics.parse(gcc_stderr(CODE, compilation.TEXT_DIAGNOSTICS))
+    error = [record for record in records if record.is_error()][0]
+    assert (error.line, error.column) == (3, 3)
+    assert "expected" in error.message
+
+
+def test_gcc_which_rejects_the_json_flag_still_compiles(monkeypatch, tmp_path):
+    monkeypatch.setattr(compilation, 'JSON_DIAGNOSTICS', '-fno-such-diagnostics-format')
+    assert compilation.JSON_DIAGNOSTICS not in compilation.gcc_flags()
+    result, binary = compilation.compile_binary(CODE, str(tmp_path))
+    assert result.startswith("Compilation error")
+    assert "line 3, column 3: error" in result
+    result, binary = compilation.compile_binary(CODE.replace('= 1', '= 1;'), str(tmp_path))
+    assert result == "Compilation successful"
+    binary.close()
@@ -0,0 +1,35 @@
+import pytest
+from lrustore import LRUStore
+
+
+@pytest.fixture
+def store():
+    store = LRUStore(':memory:', max_bytes=10)
+    yield store
+    store.close()
+
+
+def test_least_recently_used_values_are_removed(store):
+    store.put('a', 'aaaa')
+    store.put('b', 'bbbb')
+    assert store.get('a') == 'aaaa'
+    # 12 bytes do not fit, b was used last before a
+    store.put('c', 'cccc')
+    assert store.get('b') is None
+    assert store.get('a') == 'aaaa'
+    assert store.get('c') == 'cccc'
+    assert store.stats() == (2, 8)
+
+
+def test_hits_and_misses_are_counted(store):
+    store.put('a', 'x')
+    store.get('a')
+    store.get('b')
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_clear_removes_everything(store):
+    store.put('a', 'x')
+    store.clear()
+    assert store.get('a') is None
+    assert store.stats() == (0, 0)
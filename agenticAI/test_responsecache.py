@@ -0,0 +1,50 @@
+import json
+import pytest
+import transport
+from responsecache import ResponseCache
+
+URL = 'http://localhost:11434/api/chat'
+DATA = {"model": "llama3.2", "messages": [{"role": "user", "content": "Write hello world in C"}],
+        "temperature": 0.0}
+FULL = 'Here it is:\n```c\nint main(){return 0;}\n```\nThe program returns 0.'
+CUT = 'Here it is:\n```c\nint main(){return 0;}\n```'
+
+
+class Answer:
+    def __init__(self, content):
+        self.status_code = 200
+        self.text = json.dumps({"message": {"content": content}})
+
+
+@pytest.fixture
+def chat_transport(tmp_path, monkeypatch):
+    chat_transport = transport.Transport()
+    chat_transport.cache = ResponseCache(str(tmp_path / 'responses.sqlite'))
+    monkeypatch.setattr(chat_transport, 'post', lambda url, data, headers=None: Answer(FULL))
+    monkeypatch.setattr(chat_transport, 'stream_chat', lambda *args, **kwargs: iter([CUT]))
+    yield chat_transport
+    chat_transport.cache.close()
+
+
+def test_key_depends_on_the_cut_off():
+    assert ResponseCache.key(URL, DATA) != ResponseCache.key(URL, DATA, stop_at_code_block=True)
+
+
+def test_key_depends_on_the_seed():
+    assert ResponseCache.key(URL, dict(DATA, seed=1)) != ResponseCache.key(URL, dict(DATA, seed=2))
+
+
+def test_cut_off_answer_is_not_replayed_for_the_full_answer(chat_transport):
+    assert chat_transport.chat(URL, DATA, stream=True) == CUT
+    assert chat_transport.chat(URL, DATA) == FULL
+    assert chat_transport.cache.hits == 0
+
+    assert chat_transport.chat(URL, DATA, stream=True) == CUT
+    assert chat_transport.chat(URL, DATA) == FULL
+    assert chat_transport.cache.hits == 2
+
+
+def test_sampled_answers_are_not_cached(chat_transport):
+    chat_transport.chat(URL, dict(DATA, temperature=0.7))
+    chat_transport.chat(URL, dict(DATA, temperature=0.7))
+    assert chat_transport.cache.hits == 0
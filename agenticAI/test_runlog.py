@@ -0,0 +1,38 @@
+import json
+import os
+import runlog
+
+
+def test_log_is_off_without_a_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    log = runlog.RunLog()
+    log.event("compilation", "AgentCompiler-1", result="Compilation successful")
+    log.close()
+    assert log.run_id
+    assert os.listdir(tmp_path) == []
+
+
+def test_events_are_written_as_json_lines(tmp_path):
+    path = str(tmp_path / 'logs' / 'run.jsonl')
+    log = runlog.RunLog(path)
+    log.set_iteration(2)
+    log.event("run", "AgentAIC-1", summary="exited 0")
+    log.close()
+
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 1
+    assert records[0]["run"] == log.run_id
+    assert records[0]["iteration"] == 2
+    assert records[0]["summary"] == "exited 0"
+
+
+def test_file_is_rotated(tmp_path):
+    path = str(tmp_path / 'run.jsonl')
+    log = runlog.RunLog(path, max_bytes=200, backups=2)
+    for i in range(10):
+        log.event("compilation", "AgentCompiler-1", attempt=i)
+        log.flush()
+    log.close()
+    assert os.path.exists(path + '.1') and os.path.exists(path + '.2')
+    assert not os.path.exists(path + '.3')
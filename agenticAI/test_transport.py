@@ -0,0 +1,232 @@
+import json
+import threading
+import pytest
+import requests
+import transport
+from endpoints import EndpointPool
+
+URL = 'http://pool/api/chat'
+DATA = {"model": "llama3.2", "messages": [{"role": "user", "content": "hi"}], "temperature": 0.0}
+
+
+class StreamedAnswer:
+    '''A streamed answer of Ollama, which records how many requests were in flight while it was read.'''
+
+    def __init__(self, tokens, endpoint, release=None):
+        self.status_code = 200
+        self.encoding = 'utf-8'
+        self.tokens = tokens
+        self.endpoint = endpoint
+        self.release = release
+        self.in_flight_while_read = []
+
+    def iter_lines(self, decode_unicode=False):
+        for token in self.tokens:
+            if self.release is not None:
+                self.release.wait(5)
+            self.in_flight_while_read.append(self.endpoint.in_flight)
+            yield json.dumps({"message": {"content": token}, "done": False})
+        yield json.dumps({"message": {"content": ""}, "done": True})
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def pool():
+    pool = EndpointPool(addresses=["http://a:80"])
+    pool.endpoints[0].models = {"llama3.2:latest"}
+    pool._EndpointPool__probed = True
+    return pool
+
+
+def chat_transport(pool, answer):
+    chat_transport = transport.Transport()
+    chat_transport.pool = pool
+
+    class Session:
+        def post(self, *args, **kwargs):
+            return answer
+
+    chat_transport.session = lambda: Session()
+    return chat_transport
+
+
+def test_streamed_request_is_in_flight_until_it_is_read(pool):
+    endpoint = pool.endpoints[0]
+    answer = StreamedAnswer(["Hello", " world"], endpoint)
+    assert chat_transport(pool, answer).chat(URL, DATA, stream=True) == "Hello world"
+    assert answer.in_flight_while_read == [1, 1]
+    assert endpoint.in_flight == 0
+    assert endpoint.latency is not None
+
+
+def test_latency_covers_the_whole_answer(pool):
+    endpoint = pool.endpoints[0]
+    release = threading.Event()
+    threading.Timer(0.2, release.set).start()
+    answer = StreamedAnswer(["slow"], endpoint, release)
+    chat_transport(pool, answer).chat(URL, DATA, stream=True)
+    assert endpoint.latency >= 0.2
+
+
+def test_cancelled_request_is_released_without_its_latency(pool):
+    endpoint = pool.endpoints[0]
+    cancel = threading.Event()
+    cancel.set()
+    answer = StreamedAnswer(["lost"], endpoint)
+    tokens = list(chat_transport(pool, answer).stream_chat(URL, DATA, cancel=cancel))
+    assert tokens == []
+    assert endpoint.in_flight == 0
+    assert endpoint.latency is None
+
+
+def test_cancelled_chat_returns_nothing(pool):
+    endpoint = pool.endpoints[0]
+    cancel = threading.Event()
+    cancel.set()
+    answer = StreamedAnswer(["lost"], endpoint)
+    assert chat_transport(pool, answer).chat(URL, DATA, cancel=cancel) is None
+    assert endpoint.in_flight == 0
+
+
+class DroppedAnswer(StreamedAnswer):
+    '''A streamed answer whose connection drops after the tokens.'''
+
+    def iter_lines(self, decode_unicode=False):
+        for token in self.tokens:
+            yield json.dumps({"message": {"content": token}, "done": False})
+        raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+
+def answering_transport(pool, answers, **kwargs):
+    '''A transport whose server gives the answers in turn.'''
+    chat_transport = transport.Transport(**kwargs)
+    chat_transport.pool = pool
+    answers = list(answers)
+
+    class Session:
+        def post(self, *args, **kwargs):
+            return answers.pop(0)
+
+    chat_transport.session = lambda: Session()
+    return chat_transport
+
+
+def test_dropped_stream_is_sent_again(pool):
+    endpoint = pool.endpoints[0]
+    answers = [DroppedAnswer(["Hel"], endpoint), StreamedAnswer(["Hello"], endpoint)]
+    assert answering_transport(pool, answers).chat(URL, DATA, stream=True) == "Hello"
+    assert endpoint.in_flight == 0
+    assert endpoint.failures == 0
+
+
+def test_stream_which_keeps_dropping_returns_nothing(pool):
+    endpoint = pool.endpoints[0]
+    answers = [DroppedAnswer(["Hel"], endpoint) for _ in range(3)]
+    assert answering_transport(pool, answers, retries=3).chat(URL, DATA, stream=True) is None
+    assert endpoint.in_flight == 0
+
+
+def test_dropped_stream_ends_the_tokens(pool):
+    endpoint = pool.endpoints[0]
+    dropped = []
+    chat_transport = answering_transport(pool, [DroppedAnswer(["Hel", "lo"], endpoint)])
+    assert list(chat_transport.stream_chat(URL, DATA, dropped=dropped)) == ["Hel", "lo"]
+    assert len(dropped) == 1
+    assert endpoint.in_flight == 0
+
+
+@pytest.mark.parametrize("line, parsed", [
+    ('{"message": {"content": "Hi"}, "done": false}', ("Hi", False)),
+    ('{"message": {"content": ""}, "done": true}', ("", True)),
+    ('data: {"choices": [{"delta": {"content": "Hi"}, "finish_reason": null}]}', ("Hi", False)),
+    ('data: {"choices": [{"delta": {}, "finish_reason": "stop"}]}', ("", True)),
+    ('data: [DONE]', ("", True)),
+    ('', ("", False)),
+    (': keep-alive', ("", False)),
+    ('event: message', ("", False)),
+])
+def test_parse_stream_line(line, parsed):
+    assert transport.parse_stream_line(line) == parsed
+
+
+def test_code_block_detector_stops_after_the_first_block():
+    detector = transport.CodeBlockDetector()
+    tokens = ["Here:\n``", "`python\nprint(1)\n", "``", "`\n", "and more"]
+    assert [detector.feed(token) for token in tokens] == [False, False, False, True, True]
+
+
+def test_code_block_detector_ignores_inline_fences():
+    detector = transport.CodeBlockDetector()
+    assert not detector.feed("Use ``` to start a block\nthen ```c\nint x;\n")
+    assert not detector.feed("```c\n")
+
+
+@pytest.fixture
+def two_servers():
+    pool = EndpointPool(addresses=["http://a:80", "http://b:80"])
+    for endpoint in pool.endpoints:
+        endpoint.models = {"llama3.2:latest"}
+    pool._EndpointPool__probed = True
+    return pool
+
+
+def hedging_transport(pool, answers):
+    '''A hedging transport whose servers give the answers by host; the p95 is 10 ms.'''
+    chat_transport = transport.Transport(hedge=True)
+    chat_transport.pool = pool
+    for _ in range(5):
+        chat_transport.latencies.add(DATA["model"], 0.01)
+
+    class Session:
+        def post(self, target, *args, **kwargs):
+            return answers[target.split('/')[2]]
+
+    chat_transport.session = lambda: Session()
+    return chat_transport
+
+
+def test_slow_request_is_hedged(two_servers):
+    a, b = two_servers.endpoints
+    release = threading.Event()
+    answers = {"a:80": StreamedAnswer(["slow"], a, release), "b:80": StreamedAnswer(["fast"], b)}
+    try:
+        assert hedging_transport(two_servers, answers).chat(URL, DATA) == "fast"
+    finally:
+        release.set()
+
+
+def test_failed_request_is_hedged(two_servers):
+    a, b = two_servers.endpoints
+    answers = {"a:80": DroppedAnswer(["lo"], a), "b:80": StreamedAnswer(["Hello"], b)}
+    assert hedging_transport(two_servers, answers).chat(URL, DATA) == "Hello"
+    assert a.failures == 1
+
+
+def test_hedged_chat_returns_nothing_if_both_fail(two_servers):
+    a, b = two_servers.endpoints
+    answers = {"a:80": DroppedAnswer(["lo"], a), "b:80": DroppedAnswer(["lo"], b)}
+    assert hedging_transport(two_servers, answers).chat(URL, DATA) is None
+    assert a.in_flight == b.in_flight == 0
+
+
+@pytest.mark.parametrize("latency, timeout", [
+    (None, 300),        # no samples yet, the upper bound
+    (1.0, 30),          # never shorter than min_read_timeout
+    (20.0, 60),         # timeout_factor * p95
+    (200.0, 300),       # never longer than read_timeout
+])
+def test_read_timeout_follows_the_p95(latency, timeout):
+    chat_transport = transport.Transport(read_timeout=300, min_read_timeout=30, timeout_factor=3.0)
+    if latency is not None:
+        for _ in range(5):
+            chat_transport.latencies.add(DATA["model"], latency)
+    assert chat_transport.timeout(DATA["model"]) == timeout
+
+
+def test_p95_ignores_the_slowest_requests():
+    latencies = transport.LatencyTracker(min_samples=5)
+    for seconds in range(1, 101):
+        latencies.add("m", float(seconds))
+    assert latencies.percentile("m", 0.95) == 96.0
@@ -0,0 +1,42 @@
+import threading
+import writebehind
+
+
+def test_pending_write_of_a_target_is_replaced_by_a_newer_one():
+    writer = writebehind.WriteBehind()
+    written = []
+    blocked = threading.Event()
+    release = threading.Event()
+
+    def block():
+        blocked.set()
+        release.wait(5)
+
+    writer.submit('other', block)
+    blocked.wait(5)
+    # the writer is busy, so these two writes are pending at the same time
+    writer.submit('conversation', written.append, [1])
+    writer.submit('conversation', written.append, [1, 2])
+    release.set()
+    writer.flush()
+    writer.close()
+    assert written == [[1, 2]]
+
+
+def test_close_does_the_pending_writes():
+    writer = writebehind.WriteBehind()
+    written = []
+    for i in range(10):
+        writer.submit(i, written.append, i)
+    writer.close()
+    assert sorted(written) == list(range(10))
+
+
+def test_failed_write_does_not_stop_the_writer(capsys):
+    writer = writebehind.WriteBehind()
+    written = []
+    writer.submit('broken', lambda: 1 / 0)
+    writer.submit('conversation', written.append, 'ok')
+    writer.close()
+    assert written == ['ok']
+    assert "Cannot save broken" in capsys.readouterr().out
@@ -0,0 +1,362 @@
+# Warm python interpreters for running the generated programs
+#
+# Starting python3 and importing its site modules costs more than running
+# most of the generated programs. A warm interpreter is a python3 process
+# which has imported the common standard modules once; for every program
+# it forks a fresh child, which runs the program and exits.
+import atexit
+import json
+import os
+import platform
+import queue
+import resource
+import runpy
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import workspace
+
+# the modules the generated programs use most often
+DEFAULT_PRELOAD = [
+    'collections', 'copy', 'datetime', 'decimal', 'fractions', 'functools', 'heapq',
+    'itertools', 'json', 'math', 'operator', 'random', 're', 'statistics', 'string',
+    'textwrap', 'time', 'typing',
+]
+
+
+# the read system calls (read, pread64, readv), to see in /proc/<pid>/syscall
+# that a program is blocked reading its stdin
+READ_SYSCALLS = {
+    'x86_64': (0, 17, 19),
+    'aarch64': (63, 67, 65),
+}
+
+
+def blocked_on_stdin(pid) -> bool:
+    '''This function tells if the process is blocked reading its stdin.'''
+    calls = READ_SYSCALLS.get(platform.machine())
+    if calls is not None:
+        try:
+            with open(f'/proc/{pid}/syscall') as f:
+                fields = f.read().split()
+            if len(fields) > 1 and fields[0].lstrip('-').isdigit():
+                return int(fields[0]) in calls and int(fields[1], 16) == 0
+        except (OSError, ValueError):
+            pass
+    # without the system call we only see that it waits for a pipe, the only pipe it reads is stdin
+    try:
+        with open(f'/proc/{pid}/wchan') as f:
+            return 'pipe_read' in f.read()
+    except OSError:
+        return False
+
+
+class Watchdog:
+    '''This class watches a running program (on Linux, through /proc)
+    and tells if it should be stopped before its timeout:
+        "waiting for input"     it is blocked reading the stdin, which gets no input
+        "stalled"               it used no CPU time and printed nothing for stall_seconds
+    output_size() returns how much the program printed so far, and
+    input_done() tells if the writer of the stdin is done (see feed_stdin):
+    after a scripted stdin the pipe is closed and a read returns the end of the file,
+    without one a read of the stdin is blocked for good.'''
+
+    def __init__(self, pid, output_size, input_done=lambda: True, stall_seconds=3.0, interval=0.05):
+        self.pid = pid
+        self.output_size = output_size
+        self.input_done = input_done
+        self.stall_seconds = stall_seconds      # None turns the stall detection off
+        self.interval = interval                # seconds between the checks
+        self.__next_check = time.monotonic() + interval
+        self.__progress = None
+        self.__last_progress = time.monotonic()
+        self.__blocked = 0
+
+    def check(self):
+        '''This method returns the reason to stop the program, or None.'''
+        now = time.monotonic()
+        if now < self.__next_check:
+            return None
+        self.__next_check = now + self.interval
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                # the name of the program can contain spaces, the fields come after it
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            return None
+        state, cpu = fields[0], int(fields[11]) + int(fields[12])
+        if state == 'Z':
+            return None
+
+        # twice in a row, in case it was just reading the last input
+        if self.input_done() and state == 'S' and blocked_on_stdin(self.pid):
+            self.__blocked += 1
+            if self.__blocked >= 2:
+                return "waiting for input"
+        else:
+            self.__blocked = 0
+
+        progress = (cpu, self.output_size())
+        if progress != self.__progress:
+            self.__progress = progress
+            self.__last_progress = now
+        elif self.stall_seconds is not None and now - self.__last_progress >= self.stall_seconds:
+            return "stalled"
+        return None
+
+
+def _run_child(script, stdin_fd, stdout_path, stderr_path, output_limit):
+    '''This function runs the script in the forked child, like python3 script would,
+    and never returns.'''
+    code = 0
+    try:
+        # the child and everything it starts can be killed together
+        os.setsid()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        # the output files cannot grow over the limit, the child is killed instead
+        signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+        resource.setrlimit(resource.RLIMIT_FSIZE, (output_limit + 1, output_limit + 1))
+        os.dup2(stdin_fd, 0)
+        os.close(stdin_fd)
+        for fd, path, flags in ((1, stdout_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC),
+                                (2, stderr_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)):
+            opened = os.open(path, flags, 0o600)
+            os.dup2(opened, fd)
+            os.close(opened)
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', closefd=False)
+        sys.stderr = open(2, 'w', closefd=False)
+        sys.argv = [script]
+        sys.path[0] = os.path.dirname(os.path.abspath(script))
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(code)
+
+
+def wait(pid, timeout, watchdog=None):
+    '''This function waits for the child (the leader of its own process group);
+    if it runs over the timeout, or the watchdog finds a reason to stop it,
+    the whole group is killed.
+    It returns (wait status, resource usage, reason), see os.wait4; the reason
+    is None, "timeout" or the reason of the watchdog.'''
+    deadline = time.monotonic() + timeout
+    delay = 0.0005
+    while True:
+        done, status, rusage = os.wait4(pid, os.WNOHANG)
+        if done:
+            return status, rusage, None
+        reason = "timeout" if time.monotonic() >= deadline else None
+        if reason is None and watchdog is not None:
+            reason = watchdog.check()
+        if reason is not None:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, status, rusage = os.wait4(pid, 0)
+            return status, rusage, reason
+        time.sleep(delay)
+        delay = min(delay * 2, 0.02)
+
+
+def feed_stdin(fd, data):
+    '''This function writes the scripted stdin (bytes) to the pipe of the program
+    in a thread and closes the pipe, so the program reads the end of the file
+    after it (e.g. for line in sys.stdin, or scanf returning EOF).
+    Without a scripted stdin (None) nothing is written and the pipe is left
+    open to the caller: a program which reads it waits for input.
+    It returns the thread, which is alive until all data is written.'''
+    def write():
+        if data is None:
+            return
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except OSError:
+            # the program exited without reading all of it
+            pass
+        finally:
+            os.close(fd)
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread
+
+
+def serve(preload):
+    '''This function is the warm interpreter: it imports the modules and then
+    runs one job (a json line on stdin) at a time in a forked child.'''
+    for module in preload:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    channel_in = sys.stdin.buffer
+    channel_out = sys.stdout.buffer
+    channel_out.write(b'{"ready": true}\n')
+    channel_out.flush()
+
+    for line in channel_in:
+        job = json.loads(line)
+        data = None
+        if job["stdin"] is not None:
+            with open(job["stdin"], 'rb') as f:
+                data = f.read()
+        start = time.monotonic()
+        stdin_read, stdin_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(stdin_write)
+            _run_child(job["script"], stdin_read, job["stdout"], job["stderr"], job["output_limit"])
+        os.close(stdin_read)
+        writer = feed_stdin(stdin_write, data)
+        watchdog = Watchdog(pid,
+                            lambda: sum(os.path.getsize(job[name]) for name in ('stdout', 'stderr') if os.path.exists(job[name])),
+                            lambda: not writer.is_alive(),
+                            job["stall_seconds"])
+        status, rusage, reason = wait(pid, job["timeout"], watchdog)
+        writer.join(timeout=1)
+        if data is None:
+            os.close(stdin_write)
+        reply = {
+            "stopped": reason,
+            "returncode": os.waitstatus_to_exitcode(status),
+            "wall_time": time.monotonic() - start,
+            "user_time": rusage.ru_utime,
+            "sys_time": rusage.ru_stime,
+            "max_rss_kb": rusage.ru_maxrss,
+        }
+        channel_out.write(json.dumps(reply).encode('utf-8') + b'\n')
+        channel_out.flush()
+
+
+class WarmInterpreter:
+    '''This class starts and talks to one warm interpreter.
+    It runs one program at a time; if the interpreter dies, it is started again.'''
+
+    def __init__(self, executable='python3', preload=DEFAULT_PRELOAD):
+        self.executable = executable
+        self.preload = list(preload)
+        self.__process = None
+        self.__scratch = tempfile.mkdtemp(prefix='warm_', dir=workspace.get_root())
+        self.__lock = threading.Lock()
+
+    def __start(self):
+        self.__process = subprocess.Popen([self.executable, os.path.abspath(__file__), '--serve', *self.preload],
+                                          stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        if not self.__process.stdout.readline():
+            raise RuntimeError(f'The warm interpreter {self.executable} did not start')
+
+    def run(self, script: str, captures, stdin=None, timeout=10, output_limit=4 * 1024 * 1024, stall_seconds=3.0):
+        '''This method runs the script in a fresh child of the warm interpreter.
+        The stdout and the stderr of the child are passed to captures[0].feed_file
+        and captures[1].feed_file (see runner.BoundedCapture); a child which
+        writes more than output_limit bytes to one of them is killed.
+        The child reads the end of the file after the stdin; without stdin (None),
+        a child which waits for input, or one which stalls, is stopped (see Watchdog).
+        It returns a dict with stopped (None, "timeout", "waiting for input" or "stalled"),
+        returncode, wall_time, user_time, sys_time and max_rss_kb.'''
+        with self.__lock:
+            if self.__process is None or self.__process.poll() is not None:
+                self.__start()
+
+            paths = {name: os.path.join(self.__scratch, name) for name in ('stdin', 'stdout', 'stderr')}
+            with open(paths['stdin'], 'wb') as f:
+                f.write(stdin.encode('utf-8') if stdin is not None else b'')
+            job = {"script": os.path.abspath(script), "timeout": timeout, "output_limit": output_limit,
+                   "stall_seconds": stall_seconds, **paths}
+            if stdin is None:
+                job["stdin"] = None
+            self.__process.stdin.write(json.dumps(job).encode('utf-8') + b'\n')
+            self.__process.stdin.flush()
+            line = self.__process.stdout.readline()
+            if not line:
+                self.__process = None
+                raise RuntimeError(f'The warm interpreter {self.executable} died')
+            captures[0].feed_file(paths['stdout'])
+            captures[1].feed_file(paths['stderr'])
+            return json.loads(line)
+
+    def close(self):
+        with self.__lock:
+            if self.__process is not None and self.__process.poll() is None:
+                self.__process.stdin.close()
+                self.__process.wait()
+            self.__process = None
+            for name in ('stdin', 'stdout', 'stderr'):
+                try:
+                    os.remove(os.path.join(self.__scratch, name))
+                except FileNotFoundError:
+                    pass
+            try:
+                os.rmdir(self.__scratch)
+            except OSError:
+                pass
+
+
+class WarmPool:
+    '''This class keeps size warm interpreters, so size programs
+    can run at the same time (e.g. from the threads of the agents).'''
+
+    def __init__(self, size=1, executable='python3', preload=DEFAULT_PRELOAD):
+        self.executable = executable
+        self.__interpreters = [WarmInterpreter(executable, preload) for _ in range(size)]
+        self.__idle = queue.Queue()
+        for interpreter in self.__interpreters:
+            self.__idle.put(interpreter)
+
+    def run(self, script: str, captures, stdin=None, timeout=10, output_limit=4 * 1024 * 1024, stall_seconds=3.0):
+        '''This method runs the script on an idle warm interpreter, see WarmInterpreter.run.'''
+        interpreter = self.__idle.get()
+        try:
+            return interpreter.run(script, captures, stdin, timeout, output_limit, stall_seconds)
+        finally:
+            self.__idle.put(interpreter)
+
+    def close(self):
+        for interpreter in self.__interpreters:
+            interpreter.close()
+
+
+# the pool used by the executions in this process, None if it is off
+_shared_pool = None
+
+
+def get_pool():
+    '''This function returns the warm pool of the process, or None if it is off.'''
+    return _shared_pool
+
+
+def set_pool(pool):
+    '''This function turns the warm pool of the process on (a WarmPool) or off (None).'''
+    global _shared_pool
+    if _shared_pool is not None and _shared_pool is not pool:
+        _shared_pool.close()
+    _shared_pool = pool
+    if pool is not None:
+        atexit.register(pool.close)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
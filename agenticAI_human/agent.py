@@ -1,7 +1,8 @@
-import json
-import requests
+import transport
+import runlog
 import pandas as pd
 import re
+from contextwindow import ContextWindow
 
 class AgentAI:
     
@@ -9,16 +10,21 @@ class AgentAI:
     messages = [
             ]
 
+    # token budget of one request, None sends the whole conversation
+    context_tokens = None
+
     def __init__(self, 
                  server_address, 
                  model_name, 
                  my_role, 
                  max_tokens=16000,
-                 api_key=""):
+                 api_key="",
+                 context_tokens=None):
         self.server_address = server_address
         self.model_name = model_name
         self.url = f'{self.server_address}/v1/chat/completions'
         self.max_tokens = max_tokens
+        self.context_tokens = context_tokens
         # Prefer explicit api_key; else fall back to env var OPENAI_API_KEY
         self.api_key = api_key
         self.messages = [
@@ -27,50 +33,72 @@ class AgentAI:
             }
         ] 
 
-    def get_response(self, prompt):
+    def get_response(self, prompt, stream=False):
         # send a request to the ollama server
+        # with stream=True the answer is streamed and the request
+        # is stopped as soon as the first code block is complete
+        
+        # add the user prompt to the messages list
+        self.messages.append({"role": "user", "content": prompt})
+
+        data, headers = self._request(stream)
+
+        # the shared transport keeps the connection to the server alive
+        # between the turns and retries on timeouts
+        response_raw = transport.get_transport().chat(self.url, data, headers, stream=stream)
+        if response_raw is None:
+            return None
+
+        # add the response to the messages list
+        self.messages.append({"role": "assistant", "content": response_raw})
+        runlog.event("response", self, model=self.model_name,
+                     prompt_chars=len(prompt), response_chars=len(response_raw))
+        return response_raw
+
+    def stream_response(self, prompt, stop_at_code_block=False):
+        '''This method sends the prompt and yields the tokens of the answer
+        as they arrive. The caller can stop the request at any time by
+        leaving the loop; with stop_at_code_block=True the request is stopped
+        after the first fenced code block. The received part of the answer
+        is added to the messages list in both cases.'''
         
         # add the user prompt to the messages list
         self.messages.append({"role": "user", "content": prompt})
 
+        data, headers = self._request(True)
+
+        tokens = []
+        try:
+            for token in transport.get_transport().stream_chat(self.url, data, headers,
+                                                                stop_at_code_block=stop_at_code_block):
+                tokens.append(token)
+                yield token
+        finally:
+            # add the response to the messages list
+            self.messages.append({"role": "assistant", "content": ''.join(tokens)})
+
+    def _request(self, stream=False):
+        '''This method creates the body and the headers of the chat request.'''
         data = {
             "model": self.model_name,
-            "messages": self.messages,
-            "stream": False,
+            "messages": self.context_messages(),
+            "stream": stream,
             "temperature": 0.5,
             "max_tokens": self.max_tokens,             # adjust this parameter to control the length of the output
         }
         headers = {'Content-Type': 'application/json'}
         if self.api_key:
             headers['Authorization'] = f'Bearer {self.api_key}'
-
-        retries = 3
-        for attempt in range(retries):
-            try:
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['choices'][0]['message']['content']
-
-                    # add the response to the messages list
-                    self.messages.append({"role": "assistant", "content": response_raw})
-                    return response_raw
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-                    return None
+        return data, headers
+
+    def context_messages(self):
+        '''This method returns the part of the conversation which is sent to the model.
+        The whole conversation stays in self.messages (e.g. for save_to_excel),
+        but with a token budget only the system prompt, the task, the latest code
+        and as many recent turns as fit are sent.'''
+        if not self.context_tokens:
+            return self.messages
+        return ContextWindow(self.context_tokens).select(self.messages)
         
     # this function saves the messages to a file
     def save_to_csv(self,filename):
@@ -1,8 +1,6 @@
 import agent
-import subprocess
 import re
-import requests
-import json
+import transport
 import os
 from agentCompiler import AgentCompiler
 from agentStaticAnalyzer import AgentStaticAnalyzer
@@ -21,9 +19,11 @@ class AgentAIC(agent.AgentAI):
     1. The first one is the main conversation between the model and the user.
     2. The second one is the conversation between the model and the user that is aimed to solve compilation errors.'''
 
-    def __init__(self, server_address, model_name, my_role, max_tokens=16000, api_key=""):
+    def __init__(self, server_address, model_name, my_role, max_tokens=16000, api_key="", context_tokens=None,
+                 candidates=None):
         self.server_address = server_address        # address of the server
         self.model_name = model_name                # name of the model 
+        self.context_tokens = context_tokens        # token budget of one request in the main conversation
         self.url = f'{self.server_address}'    # chat API endpoint
         self.__response = ""                    # response from the model
         self.__mdCode = ""                      # markdown code block, which is part of the response
@@ -31,6 +31,8 @@ class AgentAIC(agent.AgentAI):
         self.__compile_result = ""              # result of the compilation using gcc
         self.max_tokens = max_tokens              # maximum tokens for the response
         self.api_key = api_key                    # API key for authentication
+        self.last_run = None                      # the run of the last compiled code, see runner.run_program
+        self.candidates = candidates              # repair candidates of the compiler, see compilation.set_candidates
 
         # the main conversation between the model
         self.messages = [                   
@@ -39,18 +41,48 @@ class AgentAIC(agent.AgentAI):
             }
         ] 
 
-    def get_response(self, prompt):
+    def get_response(self, prompt, stream=False):
         '''This method gets the response from the model.
-        It sends the prompt to the model and returns the response.'''
+        It sends the prompt to the model and returns the response.
+        With stream=True the request is stopped after the first code block.'''
         # send a request to the ollama server
         
         # add the user prompt to the messages list
         self.messages.append({"role": "user", "content": prompt})
 
+        data, headers = self._request(stream)
+
+        response_raw = transport.get_transport().chat(self.url, data, headers, stream=stream)
+        if response_raw is None:
+            return None
+
+        # this is the difference to the parent class
+        # now we need to ask the compiler agent to compile the code
+        # and return the result
+        # we need to add the response to the messages list
+        agentComp = AgentCompiler(server_address=self.server_address, 
+                                  model_name=self.model_name, 
+                                  trials=3,
+                                  candidates=self.candidates)
+
+
+        #strCompilerResponse = agentComp.get_response(response_raw)
+        strCodeResponse = agentComp.get_response(response_raw)
+        self.last_run = agentComp.last_run
+
+        # add the response to the messages list
+        self.messages.append({"role": "assistant", "content": strCodeResponse})
+                    
+        # contrary to the parent class, we need to return the code
+        # and not the response
+        return strCodeResponse
+
+    def _request(self, stream=False):
+        '''This method creates the body and the headers of the chat request.'''
         data = {
             "model": self.model_name,
-            "messages": self.messages,
-            "stream": False,
+            "messages": self.context_messages(),
+            "stream": stream,
             "temperature": 0.3,             # adjust this parameter to control the randomness of the output
             "max_tokens": 16000,             # adjust this parameter to control the length of the output
         }
@@ -59,49 +91,7 @@ class AgentAIC(agent.AgentAI):
         
         if self.api_key:
             headers['Authorization'] = f'Bearer {self.api_key}'
-
-        retries = 3
-        for attempt in range(retries):
-            try:
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['choices'][0]['message']['content']
-
-                    # this is the difference to the parent class
-                    # now we need to ask the compiler agent to compile the code
-                    # and return the result
-                    # we need to add the response to the messages list
-                    agentComp = AgentCompiler(server_address=self.server_address, 
-                                              model_name=self.model_name, 
-                                              trials=3)
-
-
-                    #strCompilerResponse = agentComp.get_response(response_raw)
-                    strCodeResponse = agentComp.get_response(response_raw)
-
-                    # add the response to the messages list
-                    self.messages.append({"role": "assistant", "content": strCodeResponse})
-                    
-                    # contrary to the parent class, we need to return the code
-                    # and not the response
-                    return strCodeResponse
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-                    return None
+        return data, headers
 
     def __extract_c_code(self, markdown: str) -> str:
         '''This function extracts the C code from a markdown string.'''
@@ -1,15 +1,17 @@
 import agent
-import subprocess
 import re
-import requests
-import json
+import transport
 import os
+import compilation
+import runlog
+import runner
+import workspace
 
 class AgentCompiler(agent.AgentAI):
     '''This class uses the LLM model together with a gcc compiler to compile
         and to fix potential compilation errors.'''
 
-    def __init__(self, server_address, model_name, trials):
+    def __init__(self, server_address, model_name, trials, candidates=None, run=True):
         self.server_address = server_address        # address of the server
         self.model_name = model_name                # name of the model 
         self.url = f'{self.server_address}'    # chat API endpoint
@@ -18,6 +20,12 @@ class AgentCompiler(agent.AgentAI):
         self.__code = ""                        # just the code from the markdown code block   
         self.__compile_result = ""              # result of the compilation using gcc 
         self.__trials = trials                   # number of trials to fix the compilation errors
+        # repair candidates requested and compiled at once, see compilation.set_candidates
+        self.__candidates = compilation.get_candidates() if candidates is None else candidates
+        self.last_run = None                     # the run of the compiled code, see runner.run_program
+        self.__run = run                         # run the code which compiles, to fill last_run
+        self.__binary = None                     # the binary of the last successful compilation
+        self.__workdir = workspace.create(self, 'compiler_')   # scratch directory of this agent
 
         # initial compile messages queue
         self.__initial_compile_messages = [
@@ -28,11 +36,13 @@ class AgentCompiler(agent.AgentAI):
 
         # the conversation between the model and the user
         # that is aimed to solve compilation errors
-        self.__compile_messages = self.__initial_compile_messages
+        self.__compile_messages = list(self.__initial_compile_messages)
 
     def get_response(self, code: str) -> str:
         '''This method compiles the code using gcc and tries to fix the compilation errors. 
-        It returns the result of the compilation.'''
+        It returns the result of the compilation.
+        With candidates > 1 every repair round asks for that many fixes at once,
+        compiles them in parallel and continues with the first which compiles.'''
 
         # check if the code is in the markdown code block
         # if it is, we extract the code from the markdown code block
@@ -45,27 +55,59 @@ class AgentCompiler(agent.AgentAI):
 
         # compile the code using gcc
         self.__compile_result = self.__compile_code(code)
+        runlog.event("compilation", self, attempt=0, result=self.__compile_result)
 
         #print(f'Compiling the code: {self.__code}')
 
         # if the compilation was successful, we return the result
         if self.__compile_result == "Compilation successful":
+            self.__run_code()
             return self.__code
         else:
-            # if the compilation was not successful, we try to fix it
+            # if the compilation was not successful, we try to fix it,
+            # every problem starts with a fresh compile conversation
+            self.__compile_messages = list(self.__initial_compile_messages)
             attempts = 0
             while attempts < self.__trials and self.__compile_result != "Compilation successful":
                 print(f'Attempt {attempts + 1} to fix the compilation error...')
-                self.__solve_problem()
+                if self.__candidates > 1:
+                    # the candidates are already compiled when we get them back
+                    _, code, self.__compile_result, binary = self.__solve_problem_speculative()
+                else:
+                    code = compilation.extract_c_code(self.__solve_problem())
+                    self.__compile_result, binary = compilation.compile_binary(code, self.__workdir)
+                self.__keep_binary(binary)
+                # the next round fixes the latest code
+                if code != "":
+                    self.__code = code
                 attempts += 1
+                runlog.event("compilation", self, attempt=attempts, result=self.__compile_result)
+            self.__run_code()
             return self.__code
 
+    def __run_code(self):
+        '''This method runs the code if it compiles (from the binary of that compilation)
+        and keeps how it ran in last_run.'''
+        self.last_run = None
+        if self.__run and self.__compile_result == "Compilation successful" and self.__binary is not None:
+            self.last_run = compilation.run_binary(self.__binary)
+            print(f'Run: {runner.summary(self.last_run)}')
+            runlog.event("run", self, summary=runner.summary(self.last_run))
+        self.__keep_binary(None)
+
+    def __keep_binary(self, binary):
+        '''This method keeps the binary of the last successful compilation (or None),
+        so the program is run without compiling it again.'''
+        if self.__binary is not None and self.__binary is not binary:
+            self.__binary.close()
+        self.__binary = binary
+
     def __solve_problem(self) -> str:
         '''This method solves the compilation problems using the model.
         It sends the prompt to the model and returns the response.'''
 
         # get the response from the model
-        strPrompt = f'For this program {self.__code}, I got the following compilation error: {self.__compile_result}. Please fix the code and return the fixed code in a markdown code block.'
+        strPrompt = compilation.repair_prompt(self.__code, self.__compile_result)
         
         # please note that we use the __compile_messages list to store the conversation
         # between the model and the user
@@ -75,51 +117,44 @@ class AgentCompiler(agent.AgentAI):
         strResult = self.__get_response_compilation(strPrompt)
         return strResult
 
-    def __get_response_compilation(self, prompt: str) -> str:
+    def __solve_problem_speculative(self):
+        '''This method asks the model for several fixes at the same time.
+        The first candidate is the deterministic one, the others are sampled.
+        It returns the answer, the code, the compilation result and the binary
+        of the first candidate which compiles.'''
+
+        strPrompt = compilation.repair_prompt(self.__code, self.__compile_result)
+        self.__compile_messages.append({"role": "user", "content": strPrompt})
+
+        return compilation.first_compiling(
+            lambda i, cancel: self.__get_response_compilation(strPrompt,
+                                                              temperature=0.0 if i == 0 else 0.7,
+                                                              seed=i,
+                                                              cancel=cancel),
+            self.__candidates)
+
+    def __get_response_compilation(self, prompt: str, temperature: float = 0.0, seed=None, cancel=None) -> str:
         '''This method gets the response from the model. 
-        It sends the prompt to the model and returns the response.'''
+        It sends the prompt to the model and returns the response.
+        Setting the cancel event (if given) stops the request.'''
         
         data = {
             "model": self.model_name,
             "messages": self.__compile_messages,
             "stream": False,
-            "temperature": 0.0,
+            "temperature": temperature,
         }
+        if seed is not None:
+            # different seeds give different repair candidates
+            data["seed"] = seed
         headers = {'Content-Type': 'application/json'}
         api_key = os.getenv('OPENAI_API_KEY', '')
         if api_key:
             headers['Authorization'] = f'Bearer {api_key}'
 
-        # we use three retries just in case the server is busy
+        # the shared transport retries in case the server is busy
         # or there is a timeout
-        retries = 3     
-
-
-        for attempt in range(retries):
-            try:
-                # communicate with the server
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['choices'][0]['message']['content']
-
-                    return response_raw
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-            return None
+        return transport.get_transport().chat(self.url, data, headers, cancel=cancel)
 
     def __extract_c_code(self, markdown: str) -> str:
         '''This function extracts the C code from a markdown string.'''
@@ -154,22 +189,6 @@ class AgentCompiler(agent.AgentAI):
         '''This method compiles the code using gcc.
         It returns the result of the compilation.'''
 
-        if self.__code != "":
-            with open(f'./temp/code_temp.c', 'w+') as f:
-                f.write(self.__code)
-            # compile the code using gcc
-            result = subprocess.run(['gcc', '-w', f'./temp/code_temp.c', '-o', './temp/a.out', '-lm'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # print the output of the compilation
-            # print(result.stdout.decode())
-            # print(result.stderr.decode())
-
-            # check if the output of the compilation contains the word "error"
-            if b'error' in result.stderr:
-                self.__compile_result = f"Compilation error: {result.stderr.decode()}"
-            else:
-                self.__compile_result = "Compilation successful"
-        else:
-            self.__compile_result = "No code found"   
-
-        return self.__compile_result
\ No newline at end of file
+        self.__compile_result, binary = compilation.compile_binary(self.__code, self.__workdir)
+        self.__keep_binary(binary)
+        return self.__compile_result
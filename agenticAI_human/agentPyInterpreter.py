@@ -1,15 +1,16 @@
 import agent
-import subprocess
 import re
-import requests
-import json
+import transport
+import runner
+import runlog
+import workspace
 import os
 
 class AgentInterpreter(agent.AgentAI):
     '''This class uses the LLM model together with a gcc compiler to compile
         and to fix potential compilation errors.'''
 
-    def __init__(self, server_address, model_name, trials: int = 3, timeout_seconds: int = 10):
+    def __init__(self, server_address, model_name, trials: int = 3, timeout_seconds: int = 10, stdin: str = None):
         self.server_address = server_address        # address of the server
         self.model_name = model_name                # name of the model 
         self.url = f'{self.server_address}/v1/chat/completions'    # chat API endpoint
@@ -19,6 +20,9 @@ class AgentInterpreter(agent.AgentAI):
         self.__interpret_result = ""              # result of the interpretation using python 
         self.__trials = trials                   # number of trials to fix the interpretation errors
         self.__timeout_seconds = timeout_seconds  # max seconds to wait for code execution
+        self.__stdin = stdin                     # scripted input of the program, e.g. the moves of a game
+        self.__workdir = workspace.create(self, 'interpreter_')   # scratch directory of this agent
+        self.last_run = None                     # the last run of the code, see runner.run_program
 
         # initial interpret messages queue
         self.__initial_interpret_messages = [
@@ -46,6 +50,8 @@ class AgentInterpreter(agent.AgentAI):
 
         # compile the code using gcc
         self.__interpret_result = self.__interpret_code(code)
+        runlog.event("interpretation", self, result=self.__interpret_result,
+                     summary=runner.summary(self.last_run) if self.last_run is not None else None)
 
         # if the compilation was successful, we return the result
         if self.__interpret_result == "Interpretation successful" or self.__interpret_result == "Timeout":
@@ -89,36 +95,9 @@ class AgentInterpreter(agent.AgentAI):
         if api_key:
             headers['Authorization'] = f'Bearer {api_key}'
 
-        # we use three retries just in case the server is busy
+        # the shared transport retries in case the server is busy
         # or there is a timeout
-        retries = 3     
-
-
-        for attempt in range(retries):
-            try:
-                # communicate with the server
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['choices'][0]['message']['content']
-
-                    return response_raw
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-            return None
+        return transport.get_transport().chat(self.url, data, headers)
 
     def __extract_python_code(self, markdown: str) -> str:
         '''This function extracts the Python code from a markdown string.'''
@@ -155,27 +134,42 @@ class AgentInterpreter(agent.AgentAI):
         It returns the result of the interpretation.'''
 
         if self.__code != "":
-            with open(f'./temp/code_temp.py', 'w+') as f:
+            script = os.path.join(self.__workdir, 'code_temp.py')
+
+            # a syntax error is found without starting python
+            syntax_error = runner.check_python(self.__code, script)
+            if syntax_error is not None:
+                self.last_run = syntax_error
+                self.__interpret_result = f"Interpretation error: {syntax_error['stderr']}"
+                return self.__interpret_result
+
+            with open(script, 'w+') as f:
                 f.write(self.__code)
             # interpret the code using python
-            try:
-                result = subprocess.run(
-                    ['python3', f'./temp/code_temp.py'],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=self.__timeout_seconds
-                )
-            except subprocess.TimeoutExpired:
+            # (the same code is not run again if the execution cache is on)
+            result = runner.run_program('python3', script, self.__code,
+                                        stdin=self.__stdin, timeout=self.__timeout_seconds)
+            self.last_run = result
+            if result["status"] == "timeout":
                 self.__interpret_result = "Timeout"
                 return self.__interpret_result
+            if result["status"] == "output limit":
+                self.__interpret_result = f"Interpretation error: the program was stopped because it printed too much output: {result['stdout']}"
+                return self.__interpret_result
+            if result["status"] == "waiting for input":
+                self.__interpret_result = f"Interpretation error: the program waits for input on stdin, but there is no more input. Its output was: {result['stdout']}"
+                return self.__interpret_result
+            if result["status"] == "stalled":
+                self.__interpret_result = f"Interpretation error: the program stopped making progress (no CPU time and no output for {runner.DEFAULT_STALL_SECONDS} seconds). Its output was: {result['stdout']}"
+                return self.__interpret_result
 
             # print the output of the interpretation
-            # print(result.stdout.decode())
-            # print(result.stderr.decode())
+            # print(result["stdout"])
+            # print(result["stderr"])
 
             # check if the output of the interpretation contains the word "error"
-            if b'error' in result.stderr:
-                self.__interpret_result = f"Interpretation error: {result.stderr.decode()}"
+            if 'error' in result["stderr"]:
+                self.__interpret_result = f"Interpretation error: {result['stderr']}"
             else:
                 self.__interpret_result = "Interpretation successful"
         else:
@@ -1,18 +1,21 @@
 import agent
-import subprocess
 import re
-import requests
-import json
-import pandas as pd
+import transport
 import os
+from concurrent.futures import ThreadPoolExecutor
 from agentCompiler import AgentCompiler
+import conversationstore
+import runlog
+import staticanalysis
+import workspace
 
 
 class AgentStaticAnalyzer(agent.AgentAI):
     '''This class uses the LLM model together with a gcc compiler to compile
         and to fix potential compilation errors.'''
 
-    def __init__(self, server_address, model_name, trials):
+    def __init__(self, server_address, model_name, trials, severity_threshold=staticanalysis.DEFAULT_SEVERITY_THRESHOLD,
+                 candidates=None):
         self.server_address = server_address        # address of the server
         self.model_name = model_name                # name of the model 
         self.url = f'{self.server_address}'    # chat API endpoint
@@ -21,7 +24,16 @@ class AgentStaticAnalyzer(agent.AgentAI):
         self.__code = ""                        # just the code from the markdown code block   
         self.__analyzer_result = ""              # result of the compilation using gcc 
         self.__trials = trials
+        self.__severity_threshold = severity_threshold     # findings below it do not need a fix
         self.logs = []                   # number of trials to fix the compilation errors
+        self.__saved_logs = 0            # the logs which are already in the store, see save_to_excel
+        self.__workdir = workspace.create(self, 'analyzer_')   # scratch directory of this agent
+        # the analysis only needs to know if the code compiles, it does not run it
+        self.__compiler = AgentCompiler(server_address=self.server_address,
+                                        model_name=self.model_name,
+                                        trials=3,
+                                        candidates=candidates,
+                                        run=False)
         
 
         # initial compile messages queue
@@ -60,7 +72,12 @@ class AgentStaticAnalyzer(agent.AgentAI):
             # if the compilation was not successful, we try to fix it
             attempts = 0
             while attempts < self.__trials and self.__analyzer_result != "Static Analysis successful":
-                self.__solve_problem()
+                code = self.__get_code(self.__solve_problem() or "")
+                # the fixed code is analysed again (a fix which does not
+                # change the code comes from the analysis cache)
+                if code != "":
+                    self.__code = code
+                self.__analyzer_result = self.__analyze_code(self.__code)
                 attempts = attempts + 1
             return self.__analyzer_result
 
@@ -69,7 +86,7 @@ class AgentStaticAnalyzer(agent.AgentAI):
         It sends the prompt to the model and returns the response.'''
 
         # get the response from the model
-        strPrompt = f'For this program {self.__code}, I got the following compilation error: {self.__analyzer_result}. Please fix the code and return the fixed code in a markdown code block.'
+        strPrompt = staticanalysis.repair_prompt(self.__code, self.__analyzer_result)
         
         # please note that we use the __compile_messages list to store the conversation
         # between the model and the user
@@ -94,36 +111,9 @@ class AgentStaticAnalyzer(agent.AgentAI):
         if api_key:
             headers['Authorization'] = f'Bearer {api_key}'
 
-        # we use three retries just in case the server is busy
+        # the shared transport retries in case the server is busy
         # or there is a timeout
-        retries = 3     
-
-
-        for attempt in range(retries):
-            try:
-                # communicate with the server
-                response = requests.post(self.url,
-                                        headers=headers,
-                                        json=data,
-                                        timeout=300)
-
-                if response.status_code == 200:
-                    # get the response from the server
-                    response_dict = json.loads(response.text)
-
-                    # since the response contains a lot of other things, we need to extract the content
-                    response_raw = response_dict['choices'][0]['message']['content']
-
-                    return response_raw
-                else:
-                    # on error, we print the error message
-                    print(f"Error: {response.status_code} - {response.text}")
-                    return None
-            except requests.exceptions.Timeout:
-                print(f"Timeout occurred. Retrying {attempt + 1}/{retries}...")
-                if attempt == retries - 1:
-                    print("Max retries reached. Exiting.")
-            return None
+        return transport.get_transport().chat(self.url, data, headers)
 
     def __extract_c_code(self, markdown: str) -> str:
         '''This function extracts the C code from a markdown string.'''
@@ -157,43 +147,31 @@ class AgentStaticAnalyzer(agent.AgentAI):
     def __analyze_code(self,code: str) -> str:
         #with open("debug_log.txt", "a") as f:
                 #f.write("Test")
-        '''Run cppcheck static analysis on the code.'''
-        agentComp = AgentCompiler(server_address=self.server_address, 
-                                              model_name=self.model_name, 
-                                              trials=3)
-        
-        compile_result = agentComp.get_response(code)
+        '''Run cppcheck static analysis on the code.
+        The compilation and cppcheck run at the same time, on the same snapshot of the code.'''
+        snapshot = self.__code
+        msg = "No code found"
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix='analyzer') as executor:
+            compiling = executor.submit(self.__compiler.get_response, code)
+            analysis = executor.submit(staticanalysis.run_cppcheck, snapshot, self.__workdir) if snapshot != "" else None
+            compile_result = compiling.result()
         #if compile_result == "Compilation successful":
-        if self.__code != "": #Just for the sake of testing.. The above if condition should be used in real
-            with open(f'./temp/code_temp.c', 'w+') as f:
-                f.write(self.__code)
-
-             # analyze the code using cppcheck
-            result = subprocess.run(
-            ['cppcheck', '--enable=all', '--std=c11', '--quiet', '--suppress=missingIncludeSystem', f'./temp/code_temp.c'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            analysis_output = result.stderr.decode()
-            with open("debug_log.txt", "a") as f:
-                f.write(f"Analyzer result: {analysis_output}\n")
-            
-           
-            meaningful_issues = [
-            line for line in analysis_output.splitlines()
-            if line.strip() != "" and not line.startswith("nofile:") 
-        ]
+        if analysis is not None: #Just for the sake of testing.. The above if condition should be used in real
+            findings = staticanalysis.parse_findings(analysis.result())
+
+            # only the findings at or above the severity threshold need a fix
+            meaningful_issues = staticanalysis.actionable(findings, self.__severity_threshold)
             if meaningful_issues:
-                self.__analyzer_result = f"Static Analyzer Issue: {result.stderr.decode()}"
+                self.__analyzer_result = f"Static Analyzer Issue:\n{staticanalysis.render_findings(meaningful_issues, snapshot)}"
                 msg = "Static Analyzer Issue"
-                with open("SA1.txt", "a") as f:
-                    f.write(f"Analyzer result: {self.__analyzer_result}\n") 
-                
-
             else:
                 self.__analyzer_result = "Static Analysis successful"
                 msg = "Static Analysis successful"
-                with open("SA2.txt", "a") as f:
-                    f.write(f"Analyzer result: {self.__analyzer_result}\n")        
+            runlog.event("static analysis", self, result=msg,
+                         findings=[vars(finding) for finding in findings],
+                         actionable=len(meaningful_issues))
         self.logs.append({
-           "code": self.__code,
+           "code": snapshot,
            "Issue": self.__analyzer_result,
            "result": msg
 })
@@ -208,34 +186,18 @@ class AgentStaticAnalyzer(agent.AgentAI):
         #df.to_excel(filename, index=False)
 
     def save_to_excel(self, filename):
-        text = str(self.logs)
-        with open("SA3.txt", "a") as f:
-            f.write(text)
-    
-
-        self.logs = list(self.logs)
-        # print(" LOGS:", self.logs)
-
+        '''This method appends the new analyses to the store next to the file
+        (e.g. results/analyses.sqlite for results/analyses.xlsx), so the analyses
+        of all runs are kept, and exports all of them to the file.'''
         if not self.logs:
              print("No logs to save.")
              return
 
-    # Check that each item is a dict
-        if not all(isinstance(entry, dict) for entry in self.logs):
-             print("ERROR: self.logs is not a list of dictionaries.")
-             return
-        new_df = pd.DataFrame(self.logs)
-        if os.path.exists(filename):
-        # Read existing file
-            existing_df = pd.read_excel(filename)
-        # Concatenate and remove duplicates (optional)
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        else:
-            combined_df = new_df
-
-    # Write back the full combined DataFrame
-        combined_df.to_excel(filename, index=False)
+        store = conversationstore.ConversationStore(os.path.splitext(filename)[0] + '.sqlite')
+        try:
+            store.append("static analysis", self.logs[self.__saved_logs:])
+            self.__saved_logs = len(self.logs)
+            store.export("static analysis", filename)
+        finally:
+            store.close()
         print(f" Logs saved to {filename}")
-        #df = pd.DataFrame(self.logs)
-        #df.to_excel(filename, index=False)
-       # print(f" Saved to {filename}")
\ No newline at end of file
@@ -0,0 +1,313 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import runner
+import compilecache
+import diagnostics
+import workspace
+from execcache import accepts_flag
+
+# the flags of gcc and the libraries, which come after the source;
+# the diagnostics come as JSON if gcc still accepts the flag, see gcc_flags
+GCC_FLAGS = ['-w']
+JSON_DIAGNOSTICS = '-fdiagnostics-format=json'
+TEXT_DIAGNOSTICS = '-fno-diagnostics-show-caret'
+GCC_LIBS = ['-lm']
+
+
+def gcc_flags() -> list:
+    '''This function returns the flags of gcc. The diagnostics come as JSON
+    (see diagnostics.py), unless this gcc rejects the flag (newer versions
+    deprecate it); then they come as plain text lines, without the quoted source.'''
+    if accepts_flag('gcc', JSON_DIAGNOSTICS):
+        return GCC_FLAGS + [JSON_DIAGNOSTICS]
+    return GCC_FLAGS + [TEXT_DIAGNOSTICS]
+
+
+def extract_c_code(markdown: str) -> str:
+    '''This function extracts the C code from a markdown string.'''
+    match = re.search(r"```c(.*?)```", markdown or "", re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    return ""
+
+
+class MemoryFile:
+    '''This class is a binary in memory (a memfd), which gcc can write
+    and the programs can be run from, by its path /proc/<pid>/fd/<fd>.
+    Where memfd is missing, it is a file in a scratch directory (see workspace.py).'''
+
+    def __init__(self, name='a.out'):
+        if hasattr(os, 'memfd_create'):
+            self.fd = os.memfd_create(name, os.MFD_CLOEXEC)
+            self.path = f'/proc/{os.getpid()}/fd/{self.fd}'
+            self.__workdir = None
+        else:
+            self.fd = None
+            self.__workdir = tempfile.mkdtemp(prefix='binary_', dir=workspace.get_root())
+            self.path = os.path.join(self.__workdir, name)
+
+    def read(self) -> bytes:
+        if self.fd is None:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        return os.pread(self.fd, os.fstat(self.fd).st_size, 0)
+
+    def write(self, data: bytes):
+        if self.fd is None:
+            with open(self.path, 'wb') as f:
+                f.write(data)
+            os.chmod(self.path, 0o755)
+        else:
+            os.ftruncate(self.fd, 0)
+            os.pwrite(self.fd, data, 0)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        else:
+            shutil.rmtree(self.__workdir, ignore_errors=True)
+
+
+class BinaryFile:
+    '''This class is a binary which gcc wrote to a file, e.g. <workdir>/a.out,
+    with the same interface as MemoryFile. If it owns its directory
+    (e.g. the scratch directory of a repair candidate), close removes it.'''
+
+    def __init__(self, path, owned_dir=None):
+        self.path = path
+        self.__owned_dir = owned_dir
+
+    def close(self):
+        if self.__owned_dir is not None:
+            shutil.rmtree(self.__owned_dir, ignore_errors=True)
+
+
+# compile and run without files, see set_in_memory
+_in_memory = False
+
+
+def set_in_memory(enabled: bool):
+    '''This function turns the in-memory mode of the process on or off.
+    In this mode gcc reads the source from its stdin and writes the binary
+    to a MemoryFile, from which the program is run; the workdir is not used.'''
+    global _in_memory
+    _in_memory = enabled
+
+
+def compile_c(code: str, workdir: str) -> str:
+    '''This function compiles the code using gcc in the workdir.
+    It returns the result of the compilation.
+    If the compilation cache of the process is on, the code which was
+    compiled before is not compiled again, its binary comes from the cache.'''
+    result, binary = compile_binary(code, workdir)
+    if binary is not None:
+        binary.close()
+    return result
+
+
+def compile_binary(code: str, workdir: str, owned=False):
+    '''This function compiles the code in the workdir (or in memory, see set_in_memory)
+    and keeps the binary, so it can be run without compiling it again.
+    It returns (result of the compilation, the binary or None if it does not compile),
+    the binary is a BinaryFile or a MemoryFile which the caller closes.
+    With owned=True closing the binary also removes the workdir.'''
+    if _in_memory:
+        return compile_in_memory(code)
+
+    if code == "":
+        return "No code found", None
+
+    source = os.path.join(workdir, 'code_temp.c')
+    binary = os.path.join(workdir, 'a.out')
+    with open(source, 'w+') as f:
+        f.write(code)
+
+    def gcc():
+        result = subprocess.run(['gcc', *gcc_flags(), source, '-o', binary, *GCC_LIBS],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return result.stderr.decode()
+
+    def load():
+        with open(binary, 'rb') as f:
+            return f.read()
+
+    def save(data):
+        with open(binary, 'wb') as f:
+            f.write(data)
+        os.chmod(binary, 0o755)
+
+    result = _cached_compile(code, gcc, load, save)
+    if result != "Compilation successful":
+        return result, None
+    return result, BinaryFile(binary, workdir if owned else None)
+
+
+def compile_in_memory(code: str):
+    '''This function compiles the code without touching the disk: gcc reads
+    the source from its stdin (-x c -), its temporary files go to the scratch
+    root (a tmpfs) and the binary goes to a MemoryFile.
+    It returns (result of the compilation, the MemoryFile or None if it
+    does not compile); the caller closes the MemoryFile.'''
+    if code == "":
+        return "No code found", None
+
+    binary = MemoryFile()
+
+    def gcc():
+        result = subprocess.run(['gcc', *gcc_flags(), '-pipe', '-x', 'c', '-', '-o', binary.path, *GCC_LIBS],
+                                input=code.encode('utf-8'),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                env={**os.environ, 'TMPDIR': workspace.get_root()})
+        return result.stderr.decode()
+
+    result = _cached_compile(code, gcc, binary.read, binary.write)
+    if result != "Compilation successful":
+        binary.close()
+        return result, None
+    return result, binary
+
+
+def check_c_syntax(code: str) -> str:
+    '''This function checks only the syntax (and the types) of the code,
+    without compiling and linking it; it is several times faster than the compilation.
+    It returns the diagnostics of gcc.'''
+    result = subprocess.run(['gcc', *gcc_flags(), '-fsyntax-only', '-x', 'c', '-'],
+                            input=code.encode('utf-8'),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return result.stderr.decode()
+
+
+def _cached_compile(code, gcc, load, save):
+    '''This function compiles the code with gcc(), which returns the diagnostics,
+    through the compilation cache if it is on: save(binary) puts a cached binary
+    where gcc() would write it, load() reads the binary gcc() wrote.
+    The syntax is checked first, so a code which does not parse
+    fails without the compilation and the link.'''
+    cache = compilecache.get_cache()
+    if cache is not None:
+        stderr, cached_binary, key = cache.lookup(code, 'gcc', gcc_flags() + GCC_LIBS)
+        if stderr is not None:
+            if cached_binary is not None:
+                save(cached_binary)
+            return _compile_result(stderr, code)
+
+    stderr = check_c_syntax(code)
+    if _compile_result(stderr, code) == "Compilation successful":
+        stderr = gcc()
+    result = _compile_result(stderr, code)
+    if cache is not None:
+        compiled = load() if result == "Compilation successful" else None
+        cache.store(key, stderr, compiled)
+    return result
+
+
+def _compile_result(stderr: str, code: str) -> str:
+    '''This function turns the stderr of gcc into the result of the compilation,
+    where the errors are described compactly, with the failing lines of the code.'''
+    records = diagnostics.parse(stderr)
+    if diagnostics.has_errors(records):
+        return f"Compilation error:\n{diagnostics.render(records, code)}"
+    return "Compilation successful"
+
+
+def repair_prompt(code: str, compile_result: str) -> str:
+    '''This function asks the model to fix the compilation errors of the code.'''
+    return (f'For this program:\n```c\n{code}\n```\nI got the following compilation error: '
+            f'{compile_result.removeprefix("Compilation error:").strip()}\n'
+            f'Please fix the code and return the fixed code in a markdown code block.')
+
+
+def run_binary(binary, stdin=None, timeout: int = 10):
+    '''This function runs a binary from compile_binary.
+    It returns the result of the run (see runner.run_program).'''
+    return runner.run_program(binary.path, None, None, stdin=stdin, timeout=timeout)
+
+
+def run_c(code: str, workdir: str, stdin=None, timeout: int = 10):
+    '''This function compiles the code in the workdir (or in memory) and runs it.
+    It returns the result of the run (see runner.run_program),
+    or None if the code does not compile.'''
+    result, binary = compile_binary(code, workdir)
+    if binary is None:
+        return None
+    try:
+        return run_binary(binary, stdin, timeout)
+    finally:
+        binary.close()
+
+
+# repair candidates of the compiler agents which do not get their own, see set_candidates
+_candidates = 1
+
+
+def set_candidates(candidates: int):
+    '''This function sets how many repair candidates the compiler agents
+    of the process ask for at once (see first_compiling), e.g. from --candidates.'''
+    global _candidates
+    _candidates = max(1, candidates)
+
+
+def get_candidates() -> int:
+    return _candidates
+
+
+def first_compiling(request_candidate, candidates: int):
+    '''This function asks for several repair candidates at the same time
+    and returns the first one which compiles.
+
+    request_candidate(i, cancel) returns the answer of the model for candidate i;
+    the cancel event is set as soon as a candidate compiles, then the requests
+    which are still in flight should stop (see Transport.chat).
+    Every candidate is compiled as soon as it arrives, in its own scratch
+    directory, so the candidates do not overwrite each other.
+    A candidate which fails (e.g. its request raises) is skipped.
+    It returns (answer, code, compile result, binary or None) of the winner,
+    or of the last candidate if none of them compiles; the caller closes the binary.'''
+
+    cancel = threading.Event()
+
+    def attempt(i):
+        answer = request_candidate(i, cancel)
+        if cancel.is_set():
+            # another candidate won, this one is not compiled
+            return answer, "", "No code found", None
+        code = extract_c_code(answer)
+        workdir = tempfile.mkdtemp(prefix='candidate_', dir=workspace.get_root())
+        result, binary = compile_binary(code, workdir, owned=True)
+        if binary is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return answer, code, result, binary
+
+    def close_unused(future):
+        # the binaries of the candidates which lost, also of those which finish later
+        if future.cancelled() or future.exception() is not None:
+            return
+        if future.result() is not last and future.result()[3] is not None:
+            future.result()[3].close()
+
+    executor = ThreadPoolExecutor(max_workers=candidates, thread_name_prefix='candidate')
+    futures = [executor.submit(attempt, i) for i in range(candidates)]
+    last = (None, "", "No code found", None)
+    try:
+        for finished in as_completed(futures):
+            try:
+                last = finished.result()
+            except Exception as e:
+                # the other candidates can still compile
+                print(f"Repair candidate failed: {e}")
+                continue
+            if last[2] == "Compilation successful":
+                return last
+        return last
+    finally:
+        # the requests which lost stop at their next chunk
+        cancel.set()
+        for future in futures:
+            future.add_done_callback(close_unused)
+        # we do not wait for the candidates which lost
+        executor.shutdown(wait=False, cancel_futures=True)
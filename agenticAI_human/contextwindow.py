@@ -0,0 +1,87 @@
+# rough number of characters per token of the llama/gemma tokenizers for English and code
+CHARS_PER_TOKEN = 4
+
+# every message costs a few tokens for the role and the chat template
+TOKENS_PER_MESSAGE = 4
+
+# how much of an older message is kept when it is condensed
+CONDENSED_CHARS = 200
+
+
+def estimate_tokens(text: str) -> int:
+    '''This function estimates the number of tokens of the text.
+    We do not have the tokenizers of the models, so we use the usual
+    rule of thumb of four characters per token.'''
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content")) + TOKENS_PER_MESSAGE
+
+
+class ContextWindow:
+    '''This class chooses which messages of the conversation are sent to the model,
+    so that every request stays under the token budget.
+
+    The system prompt, the original task (the first user message), the latest
+    answer of the model (its latest code) and the current prompt are always sent.
+    The other turns are added from the newest to the oldest while they fit into
+    the budget; the turns which do not fit are condensed to their beginning,
+    or left out.
+    The conversation itself is not changed.'''
+
+    def __init__(self, budget: int):
+        self.budget = budget        # maximum number of tokens of one request
+
+    @staticmethod
+    def pinned(messages: list) -> set:
+        '''This method returns the indices of the messages which are always sent.'''
+        pinned = {len(messages) - 1}
+
+        if messages and messages[0]["role"] == "system":
+            pinned.add(0)
+
+        # the original task
+        for i, message in enumerate(messages):
+            if message["role"] == "user":
+                pinned.add(i)
+                break
+
+        # the latest code, i.e. the latest answer of the model; the agents store
+        # the code there, with or without markdown (e.g. AgentAIPy stores it without)
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i]["role"] == "assistant":
+                pinned.add(i)
+                break
+
+        return pinned
+
+    def select(self, messages: list) -> list:
+        '''This method returns the messages to send to the model.'''
+        if sum(message_tokens(m) for m in messages) <= self.budget:
+            return messages
+
+        pinned = self.pinned(messages)
+        selected = {i: messages[i] for i in pinned}
+        used = sum(message_tokens(m) for m in selected.values())
+
+        # the newest turns are the most useful ones
+        for i in range(len(messages) - 1, -1, -1):
+            if i in pinned:
+                continue
+            cost = message_tokens(messages[i])
+            if used + cost <= self.budget:
+                selected[i] = messages[i]
+                used += cost
+                continue
+
+            # the turn does not fit, we try to keep its beginning
+            content = messages[i].get("content") or ""
+            condensed = {"role": messages[i]["role"],
+                         "content": content[:CONDENSED_CHARS] + " [...]"}
+            cost = message_tokens(condensed)
+            if used + cost <= self.budget:
+                selected[i] = condensed
+                used += cost
+
+        return [selected[i] for i in sorted(selected)]
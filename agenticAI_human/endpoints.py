@@ -0,0 +1,170 @@
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+import transport
+
+# the Ollama servers we use in the hackathon (see test.py)
+DEFAULT_ENDPOINTS = [
+    "http://deepthought.cse.chalmers.se:80",
+    "http://deeperthought.cse.chalmers.se:80",
+    "http://deepestthought.cse.chalmers.se:11434",
+    "http://lazythought.cse.chalmers.se:80",
+]
+
+# agents with this server address are routed by the model name only,
+# e.g. AgentAI(server_address=POOL_ADDRESS, model_name="llama3.2", ...)
+POOL_ADDRESS = "http://pool"
+
+
+def host_of(url: str) -> str:
+    '''This function returns host:port of the url, with the default port filled in.'''
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    return f'{parts.hostname}:{port}'
+
+
+def model_key(model_name: str) -> str:
+    '''This function normalizes the model name, Ollama calls "llama3.2" "llama3.2:latest".'''
+    return model_name if ':' in model_name else f'{model_name}:latest'
+
+
+class Endpoint:
+    '''This class keeps the health and the latency of one server.'''
+
+    def __init__(self, address: str):
+        self.address = address.rstrip('/')      # e.g. http://deeperthought.cse.chalmers.se:80
+        self.host = host_of(self.address)
+        self.models = set()                     # models the server serves, from /api/tags
+        self.latency = None                     # EWMA of the request latency in seconds
+        self.in_flight = 0                      # requests from this process waiting for the server
+        self.failures = 0                       # consecutive failures
+        self.ejected_until = 0.0                # the server is not used until this time
+        self.last_probe = 0.0
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def url(self, url: str) -> str:
+        '''This method moves the url (path and query) to this server.'''
+        parts = urlsplit(url)
+        base = urlsplit(self.address)
+        return urlunsplit((base.scheme, base.netloc, parts.path, parts.query, parts.fragment))
+
+    def __repr__(self):
+        return f'Endpoint({self.address}, latency={self.latency}, in_flight={self.in_flight})'
+
+
+class EndpointPool:
+    '''This class balances the requests between the servers which serve the same model.
+
+    Every request goes to the healthy server with the lowest expected waiting time,
+    i.e. the EWMA of its latency times the number of our requests in flight there.
+    A server which fails max_failures times in a row is ejected for
+    ejection_seconds. The list of models of every server is refreshed
+    from /api/tags every probe_interval seconds; a successful probe also
+    brings an ejected server back.'''
+
+    def __init__(self,
+                 addresses=DEFAULT_ENDPOINTS,
+                 probe_interval=60,
+                 alpha=0.3,
+                 max_failures=3,
+                 ejection_seconds=60):
+        self.endpoints = [Endpoint(address) for address in addresses]
+        self.probe_interval = probe_interval        # seconds between the /api/tags probes
+        self.alpha = alpha                          # weight of the newest latency in the EWMA
+        self.max_failures = max_failures            # consecutive failures before the ejection
+        self.ejection_seconds = ejection_seconds    # how long an ejected server is not used
+        self.__lock = threading.Lock()
+        self.__probed = False
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def probe(self, endpoint: Endpoint):
+        '''This method asks the server which models it serves.'''
+        try:
+            response = transport.get_transport().session().get(f'{endpoint.address}/api/tags', timeout=(5, 10))
+            models = {model_key(m['name']) for m in response.json().get('models', [])} if response.status_code == 200 else None
+        except Exception:
+            models = None
+
+        with self.__lock:
+            endpoint.last_probe = time.monotonic()
+            if models is None:
+                self.__failed(endpoint)
+            else:
+                endpoint.models = models
+                endpoint.failures = 0
+                endpoint.ejected_until = 0.0
+
+    def probe_all(self):
+        '''This method probes all servers at the same time.'''
+        threads = [threading.Thread(target=self.probe, args=(endpoint,), daemon=True) for endpoint in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.__probed = True
+
+    def start(self):
+        '''This method starts the background thread, which probes the servers periodically.'''
+        if self.__thread is not None:
+            return
+        self.probe_all()
+
+        def run():
+            while not self.__stop.wait(self.probe_interval):
+                self.probe_all()
+
+        self.__thread = threading.Thread(target=run, name='endpoint-probe', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+
+    def routes(self, url: str) -> bool:
+        '''This method tells if the requests to the url are balanced by the pool.'''
+        host = host_of(url)
+        return host == host_of(POOL_ADDRESS) or any(e.host == host for e in self.endpoints)
+
+    def select(self, url: str, model_name: str, exclude=()):
+        '''This method chooses the server for the request; the servers (host:port)
+        in exclude are not chosen, e.g. for a hedged request.
+        It returns the endpoint, or None if the request should go to the url as it is.'''
+        if not self.routes(url):
+            return None
+        if not self.__probed:
+            self.probe_all()
+
+        model = model_key(model_name or "")
+        with self.__lock:
+            candidates = [e for e in self.endpoints
+                          if model in e.models and e.healthy() and e.host not in exclude]
+            if not candidates:
+                return None
+            # servers we have not measured yet are tried first
+            endpoint = min(candidates, key=lambda e: (e.latency or 0.0) * (e.in_flight + 1))
+            endpoint.in_flight += 1
+            return endpoint
+
+    def report(self, endpoint: Endpoint, latency, ok: bool):
+        '''This method records the result of a request sent to the server;
+        latency is None if the request was cancelled before it finished.'''
+        with self.__lock:
+            endpoint.in_flight -= 1
+            if not ok:
+                self.__failed(endpoint)
+                return
+            if latency is None:
+                return
+            endpoint.failures = 0
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency = self.alpha * latency + (1 - self.alpha) * endpoint.latency
+
+    def __failed(self, endpoint: Endpoint):
+        endpoint.failures += 1
+        if endpoint.failures >= self.max_failures:
+            print(f"Endpoint {endpoint.address} failed {endpoint.failures} times, ejecting it for {self.ejection_seconds} s")
+            endpoint.ejected_until = time.monotonic() + self.ejection_seconds
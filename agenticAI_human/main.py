@@ -2,11 +2,15 @@
 # use the agent.py file to run the agent
 import argparse
 import re
-import pandas as pd
 from tqdm import tqdm       # Import tqdm for progress bar
 from agent import AgentAI   # Import the agentAI class, this is for the designer
 from agentC import AgentAIC   # Import the AgentC class, this is for the programmer
 from agentH import AgentH   # Import the AgentH class, this is for the human
+import compilecache
+import compilation
+import runlog
+import conversationstore
+import writebehind
 
 
 ## File name to save
@@ -29,8 +33,34 @@ def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Run the AgentAI with a prompt.")
     parser.add_argument("--prompt", type=str, required=True, help="The prompt to send to the agent.")
+    parser.add_argument("--compile-cache", type=str, default="", help="SQLite file to cache the gcc compilations in.")
+    parser.add_argument("--candidates", type=int, default=1, help="Repair candidates requested and compiled at once.")
+    parser.add_argument("--in-memory", action="store_true", help="Compile and run the code without writing files.")
+    parser.add_argument("--run-log", type=str, default=None, help="JSON Lines file to log the events of the run in, e.g. logs/run.jsonl; no log by default.")
+    parser.add_argument("--store", type=str, default="results/conversations.sqlite", help="SQLite file the conversations are appended to.")
     args = parser.parse_args()
 
+    # the events of all agents go to one buffered log
+    runlog.set_log(runlog.RunLog(args.run_log))
+
+    # every iteration only appends the new messages and log entries,
+    # the Excel files are written once at the end
+    store = conversationstore.ConversationStore(args.store)
+    conversation = f'{runlog.get_log().run_id}/programmer'
+    conversation_log_name = f'{runlog.get_log().run_id}/log'
+    # the writes are done in the background, the next request does not wait for them
+    writer = writebehind.get_writer()
+
+    # do not compile the same code again
+    if args.compile_cache:
+        compilecache.set_cache(compilecache.CompileCache(args.compile_cache))
+
+    # gcc reads the code from its stdin and writes the binary to memory
+    compilation.set_in_memory(args.in_memory)
+
+    # the compiler agents ask for several fixes of a compilation error at once
+    compilation.set_candidates(args.candidates)
+
     # Create an instance of the Agent class
     agentDesigner = AgentAI(server_address="http://deeperthought.cse.chalmers.se/v1/chat/completions", 
                               model_name="llama3.2:1b",
@@ -41,6 +71,8 @@ def main():
                             max_tokens=16000,
                             my_role="You are an experienced C programmer. You must solve the task given by the designer and follow the instructions from the designer. You respond with solutions, not suggestions.")
 
+    runlog.get_log().set_iteration(0)
+
     # Conversation log: list of dicts with iteration, role, prompt and response
     conversation_log = []
 
@@ -84,6 +116,7 @@ def main():
 
     for i in tqdm(range(MAX_ITERATIONS), desc="Processing iterations"):
         iteration = i + 1
+        runlog.get_log().set_iteration(iteration)
 
         # Prompt programmer with latest designer message
         prompt_to_programmer = f'For your program, the designer suggested: {responseDesigner}. \n The human provided feedback: {responseHuman}. Address these points in your next solution.'
@@ -122,18 +155,17 @@ def main():
             'response': responseHuman
         })
 
-        # Periodically save the agent's messages and the conversation log
-        agentProgrammer.save_to_excel(strFileNameToSave)
-        # also save the conversation log to an excel file
-        try:
-            pd.DataFrame(conversation_log).to_excel(strFileNameToSave.replace('.xlsx', '_log.xlsx'), index=False)
-        except Exception:
-            # ignore failures to save log while iterating
-            pass
+        # Append the new messages and conversation log entries to the store
+        writer.submit(conversation, store.sync, conversation, list(agentProgrammer.messages))
+        writer.submit(conversation_log_name, store.sync, conversation_log_name, list(conversation_log))
     
-    # After loop finishes, save final conversation log
+    # After loop finishes, save the conversation and the conversation log
     try:
-        pd.DataFrame(conversation_log).to_excel(strFileNameToSave.replace('.xlsx', '_log.xlsx'), index=False)
+        writer.submit(conversation, store.sync, conversation, list(agentProgrammer.messages))
+        writer.submit(conversation_log_name, store.sync, conversation_log_name, list(conversation_log))
+        writer.flush()
+        store.export(conversation, strFileNameToSave)
+        store.export(conversation_log_name, strFileNameToSave.replace('.xlsx', '_log.xlsx'))
         print(f"Conversation log saved to {strFileNameToSave.replace('.xlsx', '_log.xlsx')}")
     except Exception as e:
         print(f"Failed to save conversation log: {e}")
@@ -2,11 +2,13 @@
 # use the agent.py file to run the agent
 import argparse
 import re
-import pandas as pd
 from tqdm import tqdm       # Import tqdm for progress bar
 from agent import AgentAI   # Import the agentAI class, this is for the designer
 from agentC import AgentAIC   # Import the AgentC class, this is for the programmer
 from agentH import AgentH   # Import the AgentH class, this is for the human
+import conversationstore
+import writebehind
+import runlog
 
 
 ## File name to save
@@ -30,8 +32,17 @@ def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Run the AgentAI with a prompt.")
     parser.add_argument("--prompt", type=str, required=True, help="The prompt to send to the agent.")
+    parser.add_argument("--store", type=str, default="results/conversations.sqlite", help="SQLite file the conversations are appended to.")
     args = parser.parse_args()
 
+    # every iteration only appends the new messages and log entries,
+    # the Excel files are written once at the end
+    store = conversationstore.ConversationStore(args.store)
+    conversation = f'{runlog.get_log().run_id}/programmer'
+    conversation_log_name = f'{runlog.get_log().run_id}/log'
+    # the writes are done in the background, the next request does not wait for them
+    writer = writebehind.get_writer()
+
     # Create an instance of the Agent class
     agentDesigner = AgentAI(server_address="http://lazythought.cse.chalmers.se", 
                               model_name="llama3.2:3b",
@@ -126,18 +137,17 @@ def main():
                 'response': responseHuman
             })
 
-        # Periodically save the agent's messages and the conversation log
-        agentProgrammer.save_to_excel(strFileNameToSave)
-        # also save the conversation log to an excel file
-        try:
-            pd.DataFrame(conversation_log).to_excel(strFileNameToSave.replace('.xlsx', '_log.xlsx'), index=False)
-        except Exception:
-            # ignore failures to save log while iterating
-            pass
+        # Append the new messages and conversation log entries to the store
+        writer.submit(conversation, store.sync, conversation, list(agentProgrammer.messages))
+        writer.submit(conversation_log_name, store.sync, conversation_log_name, list(conversation_log))
     
-    # After loop finishes, save final conversation log
+    # After loop finishes, save the conversation and the conversation log
     try:
-        pd.DataFrame(conversation_log).to_excel(strFileNameToSave.replace('.xlsx', '_log.xlsx'), index=False)
+        writer.submit(conversation, store.sync, conversation, list(agentProgrammer.messages))
+        writer.submit(conversation_log_name, store.sync, conversation_log_name, list(conversation_log))
+        writer.flush()
+        store.export(conversation, strFileNameToSave)
+        store.export(conversation_log_name, strFileNameToSave.replace('.xlsx', '_log.xlsx'))
         print(f"Conversation log saved to {strFileNameToSave.replace('.xlsx', '_log.xlsx')}")
     except Exception as e:
         print(f"Failed to save conversation log: {e}")
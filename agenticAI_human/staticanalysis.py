@@ -0,0 +1,167 @@
+# Static analysis of the generated code with cppcheck
+#
+# python3 staticanalysis.py --stats     shows how many analyses are cached
+# python3 staticanalysis.py --clear     removes all cached analyses
+import hashlib
+import json
+import os
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from execcache import tool_version
+from lrustore import LRUStore
+
+# the checks of cppcheck, the findings come as XML
+CPPCHECK_FLAGS = ['--enable=all', '--std=c11', '--quiet', '--suppress=missingIncludeSystem',
+                  '--xml', '--xml-version=2']
+
+# the severities of cppcheck, from the least to the most serious
+SEVERITIES = ['none', 'debug', 'information', 'style', 'performance', 'portability', 'warning', 'error']
+
+# findings below this severity (e.g. style notes) are not worth a repair round
+DEFAULT_SEVERITY_THRESHOLD = 'warning'
+
+# the threads of one cppcheck run
+CPPCHECK_JOBS = min(4, os.cpu_count() or 1)
+
+
+class AnalysisCache(LRUStore):
+    '''This class is a cache of the cppcheck analyses, stored in SQLite
+    (a file, so the analyses survive between runs, or ':memory:').
+    An analysis is stored under the hash of the source, the version
+    of cppcheck and its flags, with the output of cppcheck.
+    When the stored outputs grow over max_bytes, the least recently used
+    analyses are removed.'''
+
+    table = 'analyses'
+    columns = (('output', 'TEXT NOT NULL'),)
+    description = 'the cppcheck analyses'
+    noun = 'analyses'
+
+    def __init__(self, path='cache/analyses.sqlite', max_bytes=64 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def key(code: str, flags) -> str:
+        '''This method computes the key of an analysis.'''
+        analysis = {
+            "source": code,
+            "analyzer": tool_version('cppcheck'),
+            "flags": list(flags),
+        }
+        return hashlib.sha256(json.dumps(analysis, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Finding:
+    '''This class is one finding of cppcheck: its id (e.g. "uninitvar"),
+    severity, message, location (file, line and column, None without one)
+    and CWE number (None without one).'''
+
+    def __init__(self, id, severity, message, file=None, line=None, column=None, cwe=None):
+        self.id = id
+        self.severity = severity
+        self.message = message
+        self.file = file
+        self.line = line
+        self.column = column
+        self.cwe = cwe
+
+    def at_least(self, threshold: str) -> bool:
+        '''This method tells if the finding is at least as serious as the threshold.'''
+        rank = SEVERITIES.index(self.severity) if self.severity in SEVERITIES else len(SEVERITIES)
+        return rank >= SEVERITIES.index(threshold)
+
+    def __repr__(self):
+        return f'Finding({self.id!r}, {self.severity!r}, {self.message!r}, {self.file!r}, {self.line!r})'
+
+
+def parse_findings(output: str) -> list:
+    '''This function parses the XML output (version 2) of cppcheck into Finding records.'''
+    try:
+        root = ElementTree.fromstring(output)
+    except ElementTree.ParseError as e:
+        print(f"Cannot parse the output of cppcheck: {e}")
+        return []
+    findings = []
+    for error in root.iter('error'):
+        location = error.find('location')
+        findings.append(Finding(error.get('id', ''), error.get('severity', ''),
+                                error.get('verbose') or error.get('msg', ''),
+                                location.get('file') if location is not None else None,
+                                int(location.get('line', 0)) if location is not None else None,
+                                int(location.get('column', 0)) if location is not None else None,
+                                int(error.get('cwe')) if error.get('cwe', '').isdigit() else None))
+    return findings
+
+
+def actionable(findings, threshold=DEFAULT_SEVERITY_THRESHOLD) -> list:
+    '''This function keeps the findings in the code (not e.g. the missing includes
+    without a location) which are at least as serious as the threshold, each once.'''
+    kept = {}
+    for finding in findings:
+        if finding.line and finding.at_least(threshold):
+            kept.setdefault((finding.id, finding.line, finding.message), finding)
+    return list(kept.values())
+
+
+def render_findings(findings, code: str, context=1) -> str:
+    '''This function describes the findings in a few lines, each with
+    the line of the code it is about and context lines around it.'''
+    lines = code.split('\n')
+    parts = []
+    for finding in findings:
+        cwe = f", CWE-{finding.cwe}" if finding.cwe else ""
+        parts.append(f"line {finding.line}: {finding.severity} ({finding.id}{cwe}): {finding.message}")
+        for number in range(max(1, finding.line - context), min(len(lines), finding.line + context) + 1):
+            parts.append(f"{number:5} | {lines[number - 1]}")
+    return '\n'.join(parts)
+
+
+def repair_prompt(code: str, analyzer_result: str) -> str:
+    '''This function asks the model to fix the findings of cppcheck in the code.'''
+    return (f'For this program:\n```c\n{code}\n```\nthe static analyzer reported: '
+            f'{analyzer_result.removeprefix("Static Analyzer Issue:").strip()}\n'
+            f'Please fix the code and return the fixed code in a markdown code block.')
+
+
+# the cache used by the analyses in this process; by default it is
+# in memory, so the same code is analysed once per process
+_shared_cache = AnalysisCache(':memory:')
+
+
+def get_cache():
+    '''This function returns the analysis cache of the process.'''
+    return _shared_cache
+
+
+def set_cache(cache):
+    '''This function changes the analysis cache of the process, e.g. to a file.'''
+    global _shared_cache
+    _shared_cache = cache
+
+
+def run_cppcheck(code: str, workdir: str, jobs=CPPCHECK_JOBS) -> str:
+    '''This function analyses the code with cppcheck in the workdir and returns its output
+    (XML, see parse_findings).
+    The code which was analysed before is not analysed again.
+    cppcheck keeps its build directory in the workdir, so the next
+    analysis in the same workdir only checks what changed.'''
+    cache = get_cache()
+    key = cache.key(code, CPPCHECK_FLAGS)
+    output = cache.get(key)
+    if output is not None:
+        return output
+
+    source = os.path.join(workdir, 'code_temp.c')
+    build_dir = os.path.join(workdir, 'cppcheck-build')
+    os.makedirs(build_dir, exist_ok=True)
+    with open(source, 'w+') as f:
+        f.write(code)
+    result = subprocess.run(['cppcheck', *CPPCHECK_FLAGS, f'-j{jobs}', f'--cppcheck-build-dir={build_dir}', source],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output = result.stderr.decode()
+    cache.put(key, output)
+    return output
+
+
+if __name__ == '__main__':
+    AnalysisCache.main()
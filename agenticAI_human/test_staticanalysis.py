@@ -0,0 +1,70 @@
+import pytest
+import staticanalysis
+
+CODE = '#include <stdio.h>\nint main(){\n  int x;\n  printf("%d", x);\n  return 0;\n}\n'
+
+OUTPUT = '''<?xml version="1.0" encoding="UTF-8"?>
+<results version="2">
+    <cppcheck version="2.13.0"/>
+    <errors>
+        <error id="missingIncludeSystem" severity="information" msg="Include file not found."/>
+        <error id="uninitvar" severity="error" msg="Uninitialized variable: x" verbose="Uninitialized variable: x" cwe="457">
+            <location file="code_temp.c" line="4" column="16"/>
+        </error>
+        <error id="uninitvar" severity="error" msg="Uninitialized variable: x" verbose="Uninitialized variable: x" cwe="457">
+            <location file="code_temp.c" line="4" column="16"/>
+        </error>
+        <error id="variableScope" severity="style" msg="The scope of the variable can be reduced.">
+            <location file="code_temp.c" line="3" column="7"/>
+        </error>
+    </errors>
+</results>
+'''
+
+
+def test_parse_findings():
+    findings = staticanalysis.parse_findings(OUTPUT)
+    assert [finding.id for finding in findings] == ['missingIncludeSystem', 'uninitvar', 'uninitvar', 'variableScope']
+    assert findings[0].line is None
+    assert (findings[1].line, findings[1].column, findings[1].cwe) == (4, 16, 457)
+
+
+def test_parse_findings_of_broken_output():
+    assert staticanalysis.parse_findings('cppcheck: command not found') == []
+
+
+def test_actionable_keeps_serious_findings_in_the_code_once():
+    findings = staticanalysis.actionable(staticanalysis.parse_findings(OUTPUT))
+    assert [finding.id for finding in findings] == ['uninitvar']
+
+
+def test_actionable_with_a_lower_threshold():
+    findings = staticanalysis.actionable(staticanalysis.parse_findings(OUTPUT), threshold='style')
+    assert [finding.id for finding in findings] == ['uninitvar', 'variableScope']
+
+
+def test_render_findings():
+    text = staticanalysis.render_findings(staticanalysis.actionable(staticanalysis.parse_findings(OUTPUT)), CODE)
+    assert "line 4: error (uninitvar, CWE-457): Uninitialized variable: x" in text
+    assert '    4 |   printf("%d", x);' in text
+
+
+@pytest.fixture
+def cache(tmp_path):
+    previous = staticanalysis.get_cache()
+    cache = staticanalysis.AnalysisCache(str(tmp_path / 'analyses.sqlite'))
+    staticanalysis.set_cache(cache)
+    yield cache
+    staticanalysis.set_cache(previous)
+    cache.close()
+
+
+def test_key_depends_on_the_flags():
+    assert (staticanalysis.AnalysisCache.key(CODE, staticanalysis.CPPCHECK_FLAGS)
+            != staticanalysis.AnalysisCache.key(CODE, staticanalysis.CPPCHECK_FLAGS + ['--inconclusive']))
+
+
+def test_analysed_code_is_not_analysed_again(cache, tmp_path):
+    cache.put(cache.key(CODE, staticanalysis.CPPCHECK_FLAGS), OUTPUT)
+    assert staticanalysis.run_cppcheck(CODE, str(tmp_path)) == OUTPUT
+    assert cache.hits == 1
@@ -0,0 +1,415 @@
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Transport:
+    '''This class is the HTTP layer shared by all agents.
+    It keeps one requests session with a keep-alive connection pool per host,
+    so the agents in the same process reuse their TCP connections
+    instead of opening a new one for every turn of the conversation.
+    It also contains the retry loop, which used to be copied into every agent.
+
+    The read timeout adapts to the latencies observed for the model: once
+    there are enough samples, a request is given up after timeout_factor times
+    the running p95 instead of after read_timeout. With hedge=True and an
+    endpoint pool, a request which takes longer than the p95 is sent again to
+    another server with the same model; the first answer wins and the
+    other request is cancelled.'''
+
+    def __init__(self,
+                 pool_connections=8,
+                 pool_maxsize=16,
+                 connect_timeout=10,
+                 read_timeout=300,
+                 retries=3,
+                 min_read_timeout=30,
+                 timeout_factor=3.0,
+                 hedge=False):
+        self.pool_connections = pool_connections    # number of hosts to keep a connection pool for
+        self.pool_maxsize = pool_maxsize            # number of kept-alive connections per host
+        self.connect_timeout = connect_timeout      # seconds to wait for the TCP connection
+        self.read_timeout = read_timeout            # seconds to wait for the model to answer (upper bound)
+        self.retries = retries                      # attempts on timeouts and dropped connections
+        self.min_read_timeout = min_read_timeout    # the adaptive read timeout is never shorter
+        self.timeout_factor = timeout_factor        # adaptive read timeout = factor * p95 of the model
+        self.hedge = hedge                          # send a duplicate of slow requests to another server
+        self.cache = None                           # optional ResponseCache in front of the chat requests
+        self.pool = None                            # optional EndpointPool balancing the requests between servers
+        self.latencies = LatencyTracker()           # observed latencies per model
+        self.__session = None                       # created lazily, shared by all threads
+        self.__executor = None                      # threads for the hedged requests
+        self.__lock = threading.Lock()
+
+    def session(self) -> requests.Session:
+        '''This method returns the shared session.
+        The session is created on the first use and mounts one adapter
+        for http and https, which holds the connection pools per host.'''
+        with self.__lock:
+            if self.__session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.__session = session
+            return self.__session
+
+    def timeout(self, model_name) -> float:
+        '''This method returns the read timeout for a request to the model.'''
+        p95 = self.latencies.percentile(model_name, 0.95)
+        if p95 is None:
+            return self.read_timeout
+        return min(self.read_timeout, max(self.min_read_timeout, self.timeout_factor * p95))
+
+    def post(self, url, data, headers=None, stream=False, exclude=(), chosen=None):
+        '''This method sends the request to the server.
+        It retries on timeouts and dropped connections and
+        returns the response, or None if the request failed.
+        If the transport has an endpoint pool, every attempt goes to the
+        best server serving the model, so a retry can go to another server.
+        The servers in exclude are not used; the chosen list (if given)
+        gets the server of every attempt.
+        With stream=True the response is a StreamedResponse, which tells the
+        endpoint pool how the request went when the answer is read or closed.'''
+
+        for attempt in range(self.retries):
+            endpoint = None
+            target = url
+            if self.pool is not None:
+                endpoint = self.pool.select(url, data.get("model"), exclude)
+                if endpoint is None and exclude:
+                    # there is no other server with the model
+                    return None
+                if endpoint is not None:
+                    target = endpoint.url(url)
+                    if chosen is not None:
+                        chosen.append(endpoint.host)
+
+            start = time.monotonic()
+            try:
+                response = self.session().post(target,
+                                               headers=headers,
+                                               json=data,
+                                               timeout=(self.connect_timeout, self.timeout(data.get("model"))),
+                                               stream=stream)
+            except requests.exceptions.Timeout:
+                self.__report(endpoint, start, False)
+                print(f"Timeout occurred. Retrying {attempt + 1}/{self.retries}...")
+                continue
+            except requests.exceptions.ConnectionError as e:
+                self.__report(endpoint, start, False)
+                print(f"Connection error: {e}. Retrying {attempt + 1}/{self.retries}...")
+                continue
+
+            if response.status_code == 200:
+                if stream:
+                    # the request is in flight until its answer is read
+                    return StreamedResponse(response,
+                                            lambda ok, measured: self.__report(endpoint, start, ok, measured))
+                self.__report(endpoint, start, True)
+                return response
+
+            # errors of the server count against it, errors of the request do not
+            self.__report(endpoint, start, response.status_code < 500)
+
+            # on error, we print the error message
+            print(f"Error: {response.status_code} - {response.text}")
+            return None
+
+        print("Max retries reached. Exiting.")
+        return None
+
+    def __report(self, endpoint, start, ok, measured=True):
+        '''This method tells the endpoint pool how the request went;
+        the latency of a request which was not measured (e.g. cancelled) is not used.'''
+        if endpoint is not None:
+            self.pool.report(endpoint, time.monotonic() - start if measured else None, ok)
+
+    def chat(self, url, data, headers=None, stream=False, cancel=None):
+        '''This method sends a chat request and returns only the content
+        of the answer, or None if the request failed.
+        With stream=True the answer is streamed and the request is stopped
+        as soon as the first fenced code block is closed.
+        With a cancel event the answer is streamed too, and the request is
+        stopped as soon as the event is set; then it returns None.
+        A stream which drops in the middle is sent again, at most retries times.
+        If the transport has a cache, identical requests are answered from it.'''
+        key = None
+        if self.cache is not None and self.cache.cacheable(data):
+            key = self.cache.key(url, data, stop_at_code_block=stream)
+            content = self.cache.get(key)
+            if content is not None:
+                return content
+
+        start = time.monotonic()
+        if stream or cancel is not None:
+            content = self.__streamed_chat(url, data, headers, stream, cancel)
+        elif self.hedge and self.pool is not None and self.pool.routes(url):
+            content = self.__hedged_chat(url, data, headers)
+        else:
+            response = self.post(url, data, headers)
+            content = None if response is None else extract_content(json.loads(response.text))
+
+        if content is not None:
+            self.latencies.add(data.get("model"), time.monotonic() - start)
+
+        # failed requests are not cached, the next run tries again
+        if key is not None and content is not None:
+            self.cache.put(key, content)
+        return content
+
+    def __streamed_chat(self, url, data, headers, stop_at_code_block, cancel):
+        '''This method collects a streamed answer. A stream which drops in the
+        middle is a failed attempt, as a timeout in post: the request is sent again.
+        It returns the answer, or None if all attempts failed or it was cancelled.'''
+        for attempt in range(self.retries):
+            dropped = []
+            tokens = list(self.stream_chat(url, data, headers, stop_at_code_block=stop_at_code_block,
+                                           cancel=cancel, dropped=dropped))
+            if cancel is not None and cancel.is_set():
+                return None
+            if not dropped:
+                return ''.join(tokens) if tokens else None
+            print(f"Stream dropped. Retrying {attempt + 1}/{self.retries}...")
+
+        print("Max retries reached. Exiting.")
+        return None
+
+    def __hedged_chat(self, url, data, headers):
+        '''This method sends the request and, if it is not answered within the
+        p95 latency of the model (or it fails), a duplicate to another server
+        with the model. The first answer wins; it returns None only if both fail.
+        Both requests are streamed, so the one which loses can be cancelled
+        by closing its connection, which also stops the generation on the server.'''
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=2 * self.pool_maxsize,
+                                                     thread_name_prefix='hedge')
+            executor = self.__executor
+
+        cancel = threading.Event()
+        chosen = []
+
+        def collect(exclude):
+            # a request which fails is lost, the other one can still answer
+            dropped = []
+            try:
+                tokens = list(self.stream_chat(url, data, headers, cancel=cancel, exclude=exclude,
+                                               chosen=chosen, dropped=dropped))
+            except requests.exceptions.RequestException as e:
+                print(f"Request failed: {e}")
+                return None
+            if cancel.is_set() or dropped or not tokens:
+                return None
+            return ''.join(tokens)
+
+        requests_in_flight = [executor.submit(collect, ())]
+        delay = self.latencies.percentile(data.get("model"), 0.95)
+        hedged = False
+
+        try:
+            while requests_in_flight:
+                done, _ = wait(requests_in_flight, timeout=None if hedged else delay,
+                               return_when=FIRST_COMPLETED)
+                for finished in done:
+                    requests_in_flight.remove(finished)
+                    content = finished.result()
+                    if content is not None:
+                        return content
+                if hedged:
+                    continue
+                hedged = True
+                if chosen:
+                    if done:
+                        print(f"The request to {chosen} failed, sending it to another server")
+                    else:
+                        print(f"No answer from {chosen} within p95 = {delay:.1f} s, hedging the request")
+                    requests_in_flight.append(executor.submit(collect, tuple(chosen)))
+            return None
+        finally:
+            # the request which lost stops at its next chunk
+            cancel.set()
+
+    def stream_chat(self, url, data, headers=None, stop_at_code_block=False,
+                    cancel=None, exclude=(), chosen=None, dropped=None):
+        '''This method sends a streaming chat request and yields the tokens
+        as they arrive. It understands both the NDJSON lines of Ollama's /api/chat
+        and the server-sent events of the OpenAI compatible /v1/chat/completions.
+        With stop_at_code_block=True it stops right after the first fenced
+        code block is closed, so the prose after the code is never generated.
+        Closing the generator early, or setting the cancel event,
+        closes the connection, which stops the request.
+        If the connection drops in the middle of the answer, the tokens stop
+        and the dropped list (if given) gets the error.'''
+        data = dict(data, stream=True)
+        response = self.post(url, data, headers, stream=True, exclude=exclude, chosen=chosen)
+        if response is None:
+            return
+
+        # Ollama does not always send the charset of the NDJSON stream
+        response.response.encoding = response.response.encoding or 'utf-8'
+        detector = CodeBlockDetector()
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if cancel is not None and cancel.is_set():
+                    # the request lost, how long it took says nothing about the server
+                    response.close(measured=False)
+                    return
+                token, done = parse_stream_line(line)
+                if token:
+                    yield token
+                    if stop_at_code_block and detector.feed(token):
+                        # the code is complete, we do not need the rest
+                        return
+                if done:
+                    return
+        except requests.exceptions.RequestException as e:
+            print(f"Stream dropped: {e}")
+            response.close(ok=False)
+            if dropped is not None:
+                dropped.append(e)
+        finally:
+            response.close()
+
+    def close(self):
+        '''This method closes all pooled connections.'''
+        with self.__lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+
+class StreamedResponse:
+    '''This class is a streamed response (the requests response is in response).
+    The request is reported to the endpoint pool when the answer is closed,
+    not when the headers arrive, so the latency covers the whole answer and
+    the request counts as in flight until then.'''
+
+    def __init__(self, response, report):
+        self.response = response
+        self.status_code = response.status_code
+        self.__report = report          # report(ok, measured), called once
+        self.__closed = False
+
+    def iter_lines(self, **kwargs):
+        return self.response.iter_lines(**kwargs)
+
+    def close(self, ok=True, measured=True):
+        '''This method closes the connection; the first call reports the request.'''
+        if not self.__closed:
+            self.__closed = True
+            self.__report(ok, measured)
+        self.response.close()
+
+
+class LatencyTracker:
+    '''This class keeps the latest latencies of the requests per model
+    and computes their percentiles.'''
+
+    def __init__(self, window=100, min_samples=5):
+        self.window = window                # number of latest requests per model
+        self.min_samples = min_samples      # no percentiles before this many requests
+        self.__samples = {}
+        self.__lock = threading.Lock()
+
+    def add(self, model_name, seconds: float):
+        with self.__lock:
+            self.__samples.setdefault(model_name, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_name, q: float):
+        '''This method returns the q-quantile (e.g. 0.95) of the latencies, or None.'''
+        with self.__lock:
+            samples = sorted(self.__samples.get(model_name, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def extract_content(response_dict: dict) -> str:
+    '''This function extracts the content from the response of the server.
+    Ollama's /api/chat returns it in message.content and the
+    OpenAI compatible /v1/chat/completions in choices[0].message.content.'''
+    if 'choices' in response_dict:
+        return response_dict['choices'][0]['message']['content']
+    return response_dict['message']['content']
+
+
+def parse_stream_line(line: str):
+    '''This function parses one line of a streamed answer.
+    It returns the token in the line (or "") and whether the stream is finished.'''
+    if not line:
+        return "", False
+
+    # server-sent events from /v1/chat/completions
+    if line.startswith('data:'):
+        payload = line[len('data:'):].strip()
+        if payload == '[DONE]':
+            return "", True
+        chunk = json.loads(payload)
+        choices = chunk.get('choices') or [{}]
+        token = (choices[0].get('delta') or {}).get('content') or ""
+        return token, choices[0].get('finish_reason') is not None
+
+    # other server-sent event fields, e.g. "event:" or ": keep-alive"
+    if not line.startswith('{'):
+        return "", False
+
+    # NDJSON from Ollama's /api/chat
+    chunk = json.loads(line)
+    token = (chunk.get('message') or {}).get('content') or ""
+    return token, bool(chunk.get('done'))
+
+
+class CodeBlockDetector:
+    '''This class follows a streamed answer token by token and
+    tells when the first fenced (```) code block has been closed.'''
+
+    def __init__(self):
+        self.__line = ""            # the line which is not finished yet
+        self.__in_block = False     # we are between the opening and the closing fence
+        self.closed = False         # the first code block has been closed
+
+    def feed(self, token: str) -> bool:
+        '''This method adds a token and returns True once the code block is closed.'''
+        if self.closed:
+            return True
+
+        self.__line += token
+        # only finished lines can contain a complete fence
+        *lines, self.__line = self.__line.split('\n')
+        for line in lines:
+            if not line.strip().startswith('```'):
+                continue
+            if not self.__in_block:
+                self.__in_block = True
+            elif line.strip() == '```':
+                self.closed = True
+                return True
+        return False
+
+
+# the transport shared by all agents in this process
+_shared_transport = None
+_shared_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    '''This function returns the transport shared by all agents in the process.'''
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = Transport()
+        return _shared_transport
+
+
+def set_transport(transport: Transport):
+    '''This function replaces the shared transport, e.g. to change the timeouts
+    or the pool sizes before the agents start talking to the servers.'''
+    global _shared_transport
+    with _shared_lock:
+        _shared_transport = transport
@@ -0,0 +1,98 @@
+# Write-behind persistence of the results of the agents
+#
+# The agent loop hands the writes (e.g. appending the new messages to the
+# conversation store) to one background thread and goes on with the next
+# request. There is at most one pending write per target: a newer snapshot
+# of the same target replaces the one which was not written yet.
+# The pending writes are done when the process exits, or gets SIGTERM/SIGHUP.
+import atexit
+import signal
+import sys
+import threading
+
+
+class WriteBehind:
+    '''This class is a background writer with a bounded queue of pending writes,
+    one per target (e.g. the name of a conversation). submit waits while
+    max_pending targets are pending, so a slow disk slows the agents down
+    instead of filling the memory.'''
+
+    def __init__(self, max_pending=64):
+        self.max_pending = max_pending
+        self.__pending = {}                     # target -> (function, args), in submission order
+        self.__writing = False
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__loop, daemon=True, name='writebehind')
+        self.__thread.start()
+
+    def submit(self, target, function, *args):
+        '''This method schedules function(*args) as the write of the target;
+        args should be a snapshot (e.g. a copy of the list), as the write comes later.
+        A write of the target which is still pending is dropped.'''
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('The writer is closed')
+            while target not in self.__pending and len(self.__pending) >= self.max_pending:
+                self.__condition.wait()
+            self.__pending[target] = (function, args)
+            self.__condition.notify_all()
+
+    def __loop(self):
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                target = next(iter(self.__pending))
+                function, args = self.__pending.pop(target)
+                self.__writing = True
+                self.__condition.notify_all()
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Cannot save {target}: {e}")
+            finally:
+                with self.__condition:
+                    self.__writing = False
+                    self.__condition.notify_all()
+
+    def flush(self):
+        '''This method waits until all pending writes are done.'''
+        with self.__condition:
+            while self.__pending or self.__writing:
+                self.__condition.wait()
+
+    def close(self):
+        '''This method does the pending writes and stops the background thread.'''
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+
+# the writer of the process, created at the first use, see get_writer
+_shared_writer = None
+_shared_writer_lock = threading.Lock()
+
+
+def _exit_on_signal(signum, frame):
+    # SystemExit runs the atexit functions, which do the pending writes
+    sys.exit(128 + signum)
+
+
+def get_writer() -> WriteBehind:
+    '''This function returns the write-behind writer of the process.
+    Its pending writes are done at exit; in the main thread it also turns
+    SIGTERM and SIGHUP (if they are not handled yet) into a normal exit.'''
+    global _shared_writer
+    with _shared_writer_lock:
+        if _shared_writer is None:
+            _shared_writer = WriteBehind()
+            atexit.register(_shared_writer.close)
+            if threading.current_thread() is threading.main_thread():
+                for signum in (signal.SIGTERM, signal.SIGHUP):
+                    if signal.getsignal(signum) == signal.SIG_DFL:
+                        signal.signal(signum, _exit_on_signal)
+        return _shared_writer
@@ -0,0 +1,137 @@
+# Persistent least-recently-used store in SQLite, the base of the caches
+# (responsecache.py, execcache.py, compilecache.py, staticanalysis.py)
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+
+class LRUStore:
+    '''This class is a persistent key-value store in a local SQLite database
+    (a file, so the values survive between runs, or ':memory:').
+    Every row has the size of its values and the time it was last used;
+    when the stored values grow over max_bytes, the least recently used
+    rows are removed.
+
+    A cache subclasses it with the name of its table, the columns of
+    its values and how a key is computed; a cache of a single value
+    only says how the value is stored, see encode and decode.'''
+
+    table = 'entries'                   # the table of the rows
+    columns = (('value', 'TEXT NOT NULL'),)     # the columns of the values: (name, SQL type)
+    description = 'the cached entries'  # what is stored, for the command line
+    noun = 'entries'                    # what a row is, for the command line
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path                    # the SQLite file
+        self.max_bytes = max_bytes          # size bound of the stored values
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # several processes can share the file, so we wait for their locks
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        columns = ''.join(f'{name} {sql_type}, ' for name, sql_type in self.columns)
+        self._db.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+                                key TEXT PRIMARY KEY,
+                                {columns}size INTEGER NOT NULL,
+                                last_used REAL NOT NULL)''')
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table} (last_used)')
+        self._db.commit()
+
+    def encode(self, value):
+        '''This method turns a value into what is stored in the (only) column.'''
+        return value
+
+    def decode(self, stored):
+        '''This method turns the stored column back into the value.'''
+        return stored
+
+    def get(self, key: str):
+        '''This method returns the stored value, or None.'''
+        row = self._lookup(key)
+        return None if row is None else self.decode(row[0])
+
+    def put(self, key: str, value):
+        '''This method stores the value and removes the least recently used
+        rows if the store is over its size bound.'''
+        self._store(key, (self.encode(value),))
+
+    def _lookup(self, key: str, condition='', count_miss=True):
+        '''This method returns the values stored under the key (a tuple), or None.
+        The condition (e.g. "AND binary IS NULL") narrows the row down;
+        a row which is found becomes the most recently used one.'''
+        names = ', '.join(name for name, _ in self.columns)
+        with self._lock:
+            row = self._db.execute(f'SELECT {names} FROM {self.table} WHERE key = ? {condition}',
+                                   (key,)).fetchone()
+            if row is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self._db.execute(f'UPDATE {self.table} SET last_used = ? WHERE key = ?', (time.time(), key))
+            self._db.commit()
+            self.hits += 1
+            return row
+
+    def _store(self, key: str, values: tuple):
+        '''This method stores the values of the columns under the key.'''
+        size = sum(len(v.encode('utf-8')) if isinstance(v, str) else len(v or b'') for v in values)
+        names = ', '.join(name for name, _ in self.columns)
+        marks = ', '.join('?' for _ in self.columns)
+        with self._lock:
+            self._db.execute(f'INSERT OR REPLACE INTO {self.table} (key, {names}, size, last_used) '
+                             f'VALUES (?, {marks}, ?, ?)',
+                             (key, *values, size, time.time()))
+            self.__evict()
+            self._db.commit()
+
+    def __evict(self):
+        '''This method removes the least recently used rows until the store fits its size bound.'''
+        total = self._db.execute(f'SELECT COALESCE(SUM(size), 0) FROM {self.table}').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute(f'SELECT key, size FROM {self.table} ORDER BY last_used').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            self._evicted(key)
+            total -= size
+
+    def _evicted(self, key: str):
+        '''This method is called (with the lock held) for every row which is removed,
+        e.g. to remove what refers to it in other tables.'''
+
+    def stats(self):
+        '''This method returns the number of stored rows and their size in bytes.'''
+        with self._lock:
+            return self._db.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}').fetchone()
+
+    def clear(self):
+        '''This method removes all rows.'''
+        with self._lock:
+            self._db.execute(f'DELETE FROM {self.table}')
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @classmethod
+    def main(cls):
+        '''This method is the command line of a cache: --stats and --clear.'''
+        parser = argparse.ArgumentParser(description=f"Manage the cache of {cls.description}.")
+        parser.add_argument("--path", type=str, default=None, help="The cache file (the default one of the cache).")
+        parser.add_argument("--clear", action="store_true", help=f"Remove all cached {cls.noun}.")
+        parser.add_argument("--stats", action="store_true", help=f"Show the number and the size of the cached {cls.noun}.")
+        args = parser.parse_args()
+
+        cache = cls() if args.path is None else cls(args.path)
+        if args.clear:
+            cache.clear()
+            print(f"Cleared {cache.path}")
+        count, size = cache.stats()
+        print(f"{count} cached {cls.noun}, {size} bytes")
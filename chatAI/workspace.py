@@ -0,0 +1,71 @@
+# Scratch directories of the jobs
+#
+# Every job (an agent, a worker of the executer, a repair candidate) gets
+# its own directory for the code, the binary and the output, so several
+# agents and processes can run on the same machine at the same time.
+# The directories are under the scratch root, which is memory backed
+# (tmpfs) when possible; set SCRATCH_ROOT or call set_root to change it.
+import contextlib
+import os
+import shutil
+import tempfile
+import weakref
+
+# memory backed directories, which allow running the binaries written there
+TMPFS_CANDIDATES = ['/dev/shm', f'/run/user/{os.getuid()}']
+
+_root = None
+
+
+def usable(path: str) -> bool:
+    '''This function tells if the jobs can write and run programs in the directory.'''
+    try:
+        return (os.path.isdir(path) and os.access(path, os.W_OK | os.X_OK)
+                and not os.statvfs(path).f_flag & os.ST_NOEXEC)
+    except OSError:
+        return False
+
+
+def default_root() -> str:
+    '''This function chooses the scratch root: SCRATCH_ROOT if it is set,
+    otherwise a tmpfs which allows running programs, otherwise the temp directory.'''
+    if os.getenv('SCRATCH_ROOT'):
+        return os.getenv('SCRATCH_ROOT')
+    for path in TMPFS_CANDIDATES:
+        if usable(path):
+            return path
+    return tempfile.gettempdir()
+
+
+def get_root() -> str:
+    '''This function returns the scratch root of the process.'''
+    global _root
+    if _root is None:
+        _root = default_root()
+        os.makedirs(_root, exist_ok=True)
+    return _root
+
+
+def set_root(path: str):
+    '''This function changes the scratch root of the process, e.g. to a local disk.'''
+    global _root
+    os.makedirs(path, exist_ok=True)
+    _root = path
+
+
+def create(owner, prefix='job_') -> str:
+    '''This function creates a scratch directory which lives as long as the owner,
+    e.g. an agent; it is removed when the owner is garbage collected or the process exits.'''
+    path = tempfile.mkdtemp(prefix=prefix, dir=get_root())
+    weakref.finalize(owner, shutil.rmtree, path, True)
+    return path
+
+
+@contextlib.contextmanager
+def scratch(prefix='job_'):
+    '''This function creates a scratch directory for the with block.'''
+    path = tempfile.mkdtemp(prefix=prefix, dir=get_root())
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,95 @@
+# Cache of the results of the executed programs
+#
+# python3 execcache.py --stats     shows how many results are cached
+# python3 execcache.py --clear     removes all cached results
+import functools
+import hashlib
+import json
+import subprocess
+from lrustore import LRUStore
+
+
+@functools.lru_cache(maxsize=None)
+def tool_version(executable: str) -> str:
+    '''This function returns the version of the interpreter or the compiler,
+    so the cached results are not reused after an upgrade.'''
+    try:
+        result = subprocess.run([executable, '--version'], capture_output=True, text=True, timeout=10)
+        return (result.stdout + result.stderr).strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+@functools.lru_cache(maxsize=None)
+def accepts_flag(compiler: str, flag: str) -> bool:
+    '''This function tells if the C compiler accepts the flag, e.g. a flag
+    which newer versions removed; it is checked once per process.'''
+    try:
+        result = subprocess.run([compiler, flag, '-fsyntax-only', '-x', 'c', '-'],
+                                input='int main(void) { return 0; }\n',
+                                capture_output=True, text=True, timeout=10)
+        return result.returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+class ExecutionCache(LRUStore):
+    '''This class is a persistent cache of the results of the executed programs.
+    It is stored in a local SQLite database, so the results survive between runs.
+
+    The key is a hash of the source code, the version of the interpreter
+    (or the compiler), its flags, the stdin, the timeout and the limits of
+    the output and of the stall, i.e. everything that decides the result.
+    A hit skips the execution, including the worst case of waiting for the timeout.
+    When the stored results grow over max_bytes, the least recently used
+    ones are removed.'''
+
+    table = 'executions'
+    columns = (('result', 'TEXT NOT NULL'),)
+    description = 'the executed programs'
+    noun = 'results'
+
+    def __init__(self, path='cache/executions.sqlite', max_bytes=256 * 1024 * 1024):
+        super().__init__(path, max_bytes)
+
+    @staticmethod
+    def key(source: str, executable: str, flags=(), stdin=None, timeout=None,
+            max_output=None, output_limit=None, stall_seconds=None) -> str:
+        '''This method computes the key of an execution
+        (the arguments are those of runner.run_program).'''
+        execution = {
+            "source": source,
+            "tool": tool_version(executable),
+            "flags": list(flags),
+            "stdin": stdin,
+            "timeout": timeout,
+            "max_output": max_output,
+            "output_limit": output_limit,
+            "stall_seconds": stall_seconds,
+        }
+        return hashlib.sha256(json.dumps(execution, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def encode(self, result: dict) -> str:
+        return json.dumps(result)
+
+    def decode(self, stored: str) -> dict:
+        return json.loads(stored)
+
+
+# the cache used by the executions in this process, None if caching is off
+_shared_cache = None
+
+
+def get_cache():
+    '''This function returns the execution cache of the process, or None if caching is off.'''
+    return _shared_cache
+
+
+def set_cache(cache):
+    '''This function turns the execution cache of the process on (an ExecutionCache) or off (None).'''
+    global _shared_cache
+    _shared_cache = cache
+
+
+if __name__ == '__main__':
+    ExecutionCache.main()
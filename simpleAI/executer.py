@@ -3,12 +3,30 @@
 # Date: February 14, 2025
 
 # go through the file in ./rosetta_programs directory
-# execute each file 
+# execute each file
+import argparse
+import csv
 import os
-import subprocess
+import shutil
 import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
 import pandas as pd
 from tqdm import tqdm
+import execcache
+import warmpool
+import workspace
+import runner
+
+# the scratch file of this process, in its own scratch directory, see init_worker
+scratch_file = 'temp.py'
+
+# the scripted input of every program, see --stdin
+scripted_stdin = None
+
+# the columns of the results file, the resource usage comes after the result
+COLUMNS = ['File', 'Result', 'Wall time (s)', 'User time (s)', 'System time (s)', 'Max RSS (KB)', 'Exit code', 'Signal']
 
 def extract_python_code(text):
     '''Extract the python code from the text.
@@ -20,65 +38,243 @@ def extract_python_code(text):
         return match.group(1).strip()
     return None
 
-def execute_files():
+def list_files(directory='./rosetta_programs', shard=None):
+    '''List the files to execute, sorted by name, which is the order of the serial run
+    (os.listdir returns them in the order of the file system, which differs between machines).
+    With shard=(i, N) only every N-th file starting from the i-th is listed,
+    so N machines can split one directory between them.'''
+    files = sorted(file for file in os.listdir(directory)
+                   # since the phi3 model is not good at all, we remove these files
+                   if file.endswith('.py') and 'phi3' not in file) # and 'gemma' in file
+    if shard is not None:
+        index, count = shard
+        files = files[index::count]
+    return files
+
+def execute_file(file, directory='./rosetta_programs'):
+    '''Execute one file and return its result row [file, result, resource usage...],
+    see COLUMNS, or None if the file does not contain python code.'''
+
+    # read the string from the file
+    with open(os.path.join(directory, file), 'r') as f:
+        text = f.read()
+
+    # extract the python code
+    python_code = extract_python_code(text)
+    if python_code is None:
+        return None
+    else:
+        # write the python code to the scratch file of this process
+        with open(scratch_file, 'w') as f:
+            f.write(python_code)
+
+    # here we execute the file and capture the output
+    # which is OK, Error, timed out, output limit, waiting for input or stalled
+    # (the last three are stopped before the timeout, see runner.run_program)
+    # (the same code is not executed again if the execution cache is on)
+    strResult = f'{file}'
+    oneFileRes = [strResult]
+    # the syntax is checked first, in this process
+    result = (runner.check_python(python_code, scratch_file)
+              or runner.run_program('python3', scratch_file, python_code, stdin=scripted_stdin, timeout=10))
+    if result["status"] == "timeout":
+        strR = "timed out"
+    elif result["status"] in ("output limit", "waiting for input", "stalled"):
+        strR = result["status"]
+    elif result["returncode"] != 0 or "Error" in result["stderr"]:
+        strR = "Error"
+    else:
+        strR = "OK"
+
+    # store the result of this execution in a list
+    oneFileRes.append(strR)
+
+    # and how much it cost, to find the pathological programs
+    oneFileRes += [round(result["wall_time"], 4),
+                   round(result.get("user_time", 0.0), 4),
+                   round(result.get("sys_time", 0.0), 4),
+                   result.get("max_rss_kb", ""),
+                   "" if result["returncode"] is None or result["returncode"] < 0 else result["returncode"],
+                   result.get("signal") or ""]
+    return oneFileRes
+
+class ResultWriter:
+    '''Append-only csv file with the results.
+    Every result is appended as one row when its program finishes, instead of
+    rewriting the whole file; the rows are flushed at once and synced to the disk
+    every fsync_every rows, so a crash loses at most the last unfinished line.
+    With resume=True the rows of an existing file are kept and
+    their files can be skipped. A file of an older version, whose columns
+    are the first ones of columns, is rewritten with empty new columns;
+    a file with other columns is not resumed (ValueError).'''
+
+    def __init__(self, path, columns=COLUMNS, fsync_every=50, resume=False):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.rows = []          # the rows which were already in the file
+        self.__written = 0
+
+        if resume and os.path.exists(path):
+            header, self.rows = self.__read_complete_rows()
+            if header is not None and header != list(columns):
+                if list(columns[:len(header)]) != header:
+                    raise ValueError(f'Cannot resume {path}, its columns {header} are not {list(columns)}')
+                self.rows = [row + [''] * (len(columns) - len(row)) for row in self.rows]
+                self.__rewrite(columns)
+            self.__file = open(path, 'a', newline='')
+        else:
+            self.__file = open(path, 'w', newline='')
+        self.__writer = csv.writer(self.__file, lineterminator='\n')
+        if self.__file.tell() == 0:
+            self.__writer.writerow(columns)
+            self.__file.flush()
+
+    def __read_complete_rows(self):
+        '''Read the header and the rows of the existing file; a line which
+        was cut by a crash is removed from the file.'''
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            f.truncate(end)
+        rows = list(csv.reader(data[:end].decode('utf-8').splitlines(keepends=True)))
+        if not rows:
+            return None, []
+        return rows[0], rows[1:]
+
+    def __rewrite(self, columns):
+        '''Replace the file with the header and the rows, e.g. after new columns were added.'''
+        temp = self.path + '.tmp'
+        with open(temp, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(columns)
+            writer.writerows(self.rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+    def done(self):
+        '''The files which already have a result.'''
+        return {row[0] for row in self.rows}
+
+    def write(self, row):
+        self.__writer.writerow(row)
+        self.__file.flush()
+        self.__written += 1
+        if self.__written % self.fsync_every == 0:
+            os.fsync(self.__file.fileno())
+
+    def close(self):
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__file.close()
+
+def init_worker(cache=None, warm=False, stdin=None, scratch_root=None):
+    '''Give every worker process (or the process of the serial run)
+    its own scratch directory under the scratch root, which is removed
+    when the process exits, its own connection to the execution cache
+    and its own warm interpreter.'''
+    global scratch_file, scripted_stdin
+    scripted_stdin = stdin
+    if scratch_root:
+        workspace.set_root(scratch_root)
+    scratch_dir = tempfile.mkdtemp(prefix='executer_', dir=workspace.get_root())
+    scratch_file = os.path.join(scratch_dir, 'temp.py')
+    util.Finalize(None, shutil.rmtree, args=(scratch_dir, True), exitpriority=10)
+    if cache:
+        execcache.set_cache(execcache.ExecutionCache(cache))
+    if warm:
+        warmpool.set_pool(warmpool.WarmPool())
+
+def execute_files(directory='./rosetta_programs', workers=1, shard=None, output='results.csv', resume=False, cache=None, warm=False, stdin=None, scratch_root=None):
     '''Go through the files in the rosetta_programs directory
-    Execute each file and store the result in a csv file'''
+    Execute each file and store the result in a csv file.
+    With workers > 1 the files are executed by a pool of processes;
+    the results are in the same order as in the serial run.
+    With resume=True the files which already have a result in the
+    output file are not executed again.
+    With cache set to an SQLite file the results of the executions are
+    cached there, so unchanged code is not executed again in the next run.
+    With warm=True the programs are run by warm python interpreters,
+    which do not pay the start of python3 for every program.
+    stdin is the scripted input of every program, after it a program reads
+    the end of the file; without stdin a program which waits for input is stopped.
+    The programs are written to the scratch root (see workspace.py),
+    so several runs can share a machine.'''
+
+    # every result is appended to the csv file as soon as we have it
+    writer = ResultWriter(output, resume=resume)
 
-    # list to store the results, which we need for converting to 
+    # list to store the results, which we need for converting to
     # a pandas dataframe and then to a csv file
-    list_results = []
-
-    # go through the files in the rosetta_programs directory
-    for file in tqdm(os.listdir('./rosetta_programs')):
-        
-        # since the phi3 model is not good at all, we remove these files
-        if file.endswith('.py') and 'phi3' not in file: # and 'gemma' in file:
-            
-            # read the string from the file
-            with open(os.path.join('./rosetta_programs', file), 'r') as f:
-                text = f.read()
-            
-            # extract the python code
-            python_code = extract_python_code(text)
-            if python_code is None:
+    list_results = list(writer.rows)
+    done = writer.done()
+    files = [file for file in list_files(directory, shard) if file not in done]
+
+    try:
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(cache, warm, stdin, scratch_root))
+            # map keeps the order of the files
+            rows = executor.map(execute_file, files, [directory] * len(files), chunksize=4)
+        else:
+            executor = None
+            init_worker(cache, warm, stdin, scratch_root)
+            rows = (execute_file(file, directory) for file in files)
+
+        # go through the files in the rosetta_programs directory
+        for oneFileRes in tqdm(rows, total=len(files)):
+            if oneFileRes is None:
                 continue
-            else:
-                # write the python code to a new file
-                with open('temp.py', 'w') as f:
-                    f.write(python_code)
-            
-            # here we execute the file and capture the output
-            # which is OK, Error or timed out
-            try:
-                strResult = f'{file}'
-                oneFileRes = [strResult]
-                strR = ""
-                result = subprocess.run(['python3', './temp.py'], 
-                                        capture_output=True, 
-                                        text=True, 
-                                        check=True, 
-                                        timeout=10)
-                strR += "Error" if "Error" in result.stderr else "OK"
-            except subprocess.CalledProcessError as e:
-                strR = "Error"
-            except subprocess.TimeoutExpired:
-                strR = "timed out"
-            
-            # store the result of this execution in a list 
-            oneFileRes.append(strR)
-            
+
             # append the result of this file to the list of results
+            # and to the csv file
             list_results.append(oneFileRes)
+            writer.write(oneFileRes)
 
-            # convert the list of results to a pandas dataframe
-            # and save to a csv file
-            df = pd.DataFrame(list_results, columns=['File', 'Result'])
-            df.to_csv('results.csv', index=False)
+        if executor is not None:
+            executor.shutdown()
+    finally:
+        writer.close()
     return list_results
 
+def merge_results(shard_files, output='results.csv'):
+    '''Merge the results of the shards into one file,
+    in the same order as the serial run, i.e. sorted by the file name (see list_files).'''
+    df = pd.concat([pd.read_csv(f) for f in sorted(shard_files)], ignore_index=True)
+    df = df.sort_values('File', kind='stable', ignore_index=True)
+    df.to_csv(output, index=False)
+    return df
+
+def parse_shard(text):
+    '''Parse the shard in the form i/N, e.g. 0/4.'''
+    index, count = (int(x) for x in text.split('/'))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f'shard {text} is not in 0/N .. N-1/N')
+    return index, count
+
 # main function that calls the execute_files function
 # and saves the results to a csv file
 if __name__ == '__main__':
-    lstResults = execute_files()
-    df = pd.DataFrame(lstResults, columns=['File', 'Result'])
-    df.to_csv('results.csv', index=False)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Execute the programs generated by the models.")
+    parser.add_argument("--directory", type=str, default='./rosetta_programs', help="Directory with the generated programs.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of programs executed at the same time.")
+    parser.add_argument("--shard", type=parse_shard, default=None, help="Execute only the shard i/N of the directory.")
+    parser.add_argument("--output", type=str, default=None, help="The csv file with the results.")
+    parser.add_argument("--merge", type=str, nargs='+', default=None, help="Merge the result files of the shards.")
+    parser.add_argument("--resume", action="store_true", help="Skip the files which already have a result in the output file.")
+    parser.add_argument("--cache", type=str, default=None, help="SQLite file to cache the results of the executions in.")
+    parser.add_argument("--warm", action="store_true", help="Run the programs in warm python interpreters.")
+    parser.add_argument("--stdin", type=str, default=None, help="File with the scripted input of every program.")
+    parser.add_argument("--scratch-root", type=str, default=None, help="Directory for the scratch files, a tmpfs by default.")
+    args = parser.parse_args()
+
+    if args.merge:
+        merge_results(args.merge, args.output or 'results.csv')
+    else:
+        stdin = None
+        if args.stdin:
+            with open(args.stdin, 'r') as f:
+                stdin = f.read()
+        output = args.output or ('results.csv' if args.shard is None else f'results_{args.shard[0]}_of_{args.shard[1]}.csv')
+        lstResults = execute_files(args.directory, args.workers, args.shard, output, args.resume, args.cache, args.warm, stdin, args.scratch_root)
+        df = pd.DataFrame(lstResults, columns=COLUMNS)
+        df.to_csv(output, index=False)
@@ -0,0 +1,39 @@
+import sys
+import pytest
+import execcache
+import runner
+
+SOURCE = 'print("x" * 100)\n'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = execcache.ExecutionCache(str(tmp_path / 'executions.sqlite'))
+    execcache.set_cache(cache)
+    yield cache
+    execcache.set_cache(None)
+    cache.close()
+
+
+@pytest.mark.parametrize('limit', [{'max_output': 16}, {'output_limit': 10}, {'stall_seconds': 1}])
+def test_key_depends_on_the_limits(limit):
+    assert (execcache.ExecutionCache.key(SOURCE, sys.executable, timeout=10)
+            != execcache.ExecutionCache.key(SOURCE, sys.executable, timeout=10, **limit))
+
+
+def test_same_run_is_cached(cache, tmp_path):
+    script = tmp_path / 'code_temp.py'
+    script.write_text(SOURCE)
+    first = runner.run_program(sys.executable, str(script), SOURCE)
+    second = runner.run_program(sys.executable, str(script), SOURCE)
+    assert cache.hits == 1
+    assert second["cached"] and second["stdout"] == first["stdout"]
+
+
+def test_run_with_a_smaller_output_limit_is_not_served_from_the_cache(cache, tmp_path):
+    script = tmp_path / 'code_temp.py'
+    script.write_text(SOURCE)
+    assert runner.run_program(sys.executable, str(script), SOURCE)["status"] == "exited"
+    limited = runner.run_program(sys.executable, str(script), SOURCE, output_limit=10)
+    assert cache.hits == 0
+    assert limited["status"] == "output limit"
@@ -0,0 +1,90 @@
+import csv
+import os
+import pytest
+from executer import COLUMNS, ResultWriter, list_files, merge_results
+
+ROW = ['a.py', 'OK', 0.01, 0.01, 0.0, 9000, 0, '']
+
+
+def read(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_resume_keeps_the_rows_and_drops_a_cut_line(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    writer = ResultWriter(path)
+    writer.write(ROW)
+    writer.close()
+    with open(path, 'a') as f:
+        f.write('b.py,O')
+
+    writer = ResultWriter(path, resume=True)
+    assert writer.done() == {'a.py'}
+    writer.write(['c.py'] + ROW[1:])
+    writer.close()
+    assert [row[0] for row in read(path)] == ['File', 'a.py', 'c.py']
+
+
+def test_resume_rewrites_a_file_with_the_old_columns(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    with open(path, 'w') as f:
+        f.write('File,Result\na.py,OK\n')
+
+    writer = ResultWriter(path, resume=True)
+    assert writer.done() == {'a.py'}
+    writer.write(['b.py'] + ROW[1:])
+    writer.close()
+
+    rows = read(path)
+    assert rows[0] == COLUMNS
+    assert rows[1] == ['a.py', 'OK'] + [''] * (len(COLUMNS) - 2)
+    assert all(len(row) == len(COLUMNS) for row in rows)
+
+
+def test_resume_refuses_a_file_with_other_columns(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    with open(path, 'w') as f:
+        f.write('Program,Status\na.py,OK\n')
+
+    with pytest.raises(ValueError):
+        ResultWriter(path, resume=True)
+    assert read(path)[0] == ['Program', 'Status']
+
+
+def test_resume_of_an_empty_file_writes_the_header(tmp_path):
+    path = tmp_path / 'results.csv'
+    path.write_text('')
+    ResultWriter(str(path), resume=True).close()
+    assert read(path) == [COLUMNS]
+
+
+@pytest.fixture
+def programs(tmp_path, monkeypatch):
+    for name in ['c.py', 'a.py', 'd.py', 'b.py', 'notes.txt']:
+        (tmp_path / name).write_text('print(1)\n')
+    # a file system which lists the files in another order
+    listdir = os.listdir
+    monkeypatch.setattr(os, 'listdir', lambda directory: list(reversed(listdir(directory))))
+    return str(tmp_path)
+
+
+def test_files_and_shards_are_listed_by_name(programs):
+    assert list_files(programs) == ['a.py', 'b.py', 'c.py', 'd.py']
+    assert list_files(programs, (0, 2)) == ['a.py', 'c.py']
+    assert list_files(programs, (1, 2)) == ['b.py', 'd.py']
+
+
+def test_merged_shards_are_in_the_order_of_the_serial_run(programs, tmp_path):
+    shards = []
+    for index in range(2):
+        path = str(tmp_path / f'results_{index}_of_2.csv')
+        writer = ResultWriter(path)
+        for file in reversed(list_files(programs, (index, 2))):
+            writer.write([file] + ROW[1:])
+        writer.close()
+        shards.append(path)
+
+    output = str(tmp_path / 'results.csv')
+    merge_results(list(reversed(shards)), output)
+    assert [row[0] for row in read(output)[1:]] == list_files(programs)
@@ -0,0 +1,104 @@
+import sys
+import pytest
+import runner
+import warmpool
+
+
+def run(tmp_path, code, **limits):
+    script = tmp_path / 'code_temp.py'
+    script.write_text(code)
+    return runner.run_program(sys.executable, str(script), None, **limits)
+
+
+def test_program_exits(tmp_path):
+    result = run(tmp_path, 'print("hello")\n')
+    assert result["status"] == "exited"
+    assert result["returncode"] == 0 and result["signal"] is None
+    assert result["stdout"] == "hello\n"
+    assert result["max_rss_kb"] > 0
+
+
+def test_exit_code_and_signal(tmp_path):
+    assert run(tmp_path, 'import sys\nsys.exit(3)\n')["returncode"] == 3
+    killed = run(tmp_path, 'import os, signal\nos.kill(os.getpid(), signal.SIGSEGV)\n')
+    assert killed["returncode"] == -11 and killed["signal"] == "SIGSEGV"
+
+
+def test_timeout(tmp_path):
+    # the program uses CPU time, so it is not stalled
+    result = run(tmp_path, 'while True:\n    pass\n', timeout=1)
+    assert result["status"] == "timeout"
+    assert result["wall_time"] < 5
+
+
+def test_output_limit(tmp_path):
+    result = run(tmp_path, 'while True:\n    print("x" * 1000)\n', output_limit=100000, timeout=10)
+    assert result["status"] == "output limit"
+    assert result["wall_time"] < 5
+
+
+def test_output_keeps_its_beginning_and_end(tmp_path):
+    result = run(tmp_path, 'print("first")\nprint("x" * 100000)\nprint("last")\n', max_output=1024)
+    assert result["stdout"].startswith("first")
+    assert result["stdout"].rstrip().endswith("last")
+    assert "bytes cut" in result["stdout"]
+    assert len(result["stdout"]) < 2048
+
+
+def test_waiting_for_input(tmp_path):
+    result = run(tmp_path, 'print("question")\nprint(input())\n', timeout=10)
+    assert result["status"] == "waiting for input"
+    assert result["stdout"].startswith("question")
+    assert result["wall_time"] < 5
+
+
+@pytest.fixture(params=['cold', 'warm'])
+def mode(request):
+    if request.param == 'warm':
+        warmpool.set_pool(warmpool.WarmPool(executable=sys.executable))
+    yield request.param
+    if request.param == 'warm':
+        warmpool.get_pool().close()
+        warmpool.set_pool(None)
+
+
+@pytest.mark.parametrize('code', ['import sys\nfor line in sys.stdin:\n    print(line.strip().upper())\n',
+                                  'import sys\nprint(sys.stdin.read().upper(), end="")\n'])
+def test_program_reading_to_the_end_of_the_scripted_input(tmp_path, mode, code):
+    result = run(tmp_path, code, stdin='a\nb\n', timeout=10)
+    assert result["status"] == "exited"
+    assert result["stdout"] == "A\nB\n"
+
+
+def test_program_reading_more_than_the_scripted_input_gets_the_end_of_the_file(tmp_path, mode):
+    result = run(tmp_path, 'print(input())\nprint(input())\n', stdin='one\n', timeout=10)
+    assert result["status"] == "exited"
+    assert result["stdout"] == "one\n"
+    assert "EOFError" in result["stderr"]
+
+
+def test_stalled(tmp_path):
+    result = run(tmp_path, 'import time\ntime.sleep(60)\n', stall_seconds=1, timeout=30)
+    assert result["status"] == "stalled"
+    assert result["wall_time"] < 10
+
+
+def test_stall_detection_can_be_turned_off(tmp_path):
+    result = run(tmp_path, 'import time\ntime.sleep(2)\n', stall_seconds=None, timeout=1)
+    assert result["status"] == "timeout"
+
+
+@pytest.mark.parametrize('capture_size', [16, 1024])
+def test_bounded_capture_counts_all_bytes(capture_size):
+    capture = runner.BoundedCapture(capture_size)
+    for _ in range(100):
+        capture.feed(b'0123456789')
+    assert capture.total == 1000
+    assert len(capture.head) + len(capture.tail) <= capture_size
+
+
+def test_check_python_finds_a_syntax_error_without_running_it():
+    assert runner.check_python('print("ok")\n') is None
+    failed = runner.check_python('print("ok"\n')
+    assert failed["returncode"] == 1
+    assert "SyntaxError" in failed["stderr"]